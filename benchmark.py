@@ -0,0 +1,172 @@
+"""Repeatable latency/throughput benchmark for the emergency classifier.
+
+Every backend in model_config.BACKENDS whose model file exists is measured
+at each thread setting, each in a fresh subprocess so load times are cold
+and peak RSS belongs to that configuration alone. Per configuration:
+
+* import_s           importing TensorFlow
+* load_s             loading the model file(s)
+* first_inference_s  first batch-1 call, including graph tracing
+* latency_ms         steady-state p50/p95/p99/mean at batch size 1
+* throughput         images/sec for each batch size
+* peak_rss_mb        peak resident set size of the process
+
+Results are written as JSON together with a description of the host, so
+runs on different hardware or commits can be diffed.
+
+    python benchmark.py --threads 0 1 4 --output results.json
+
+A thread count of 0 keeps the tuned profile from thread_config.json, or the
+runtime default if there is none.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import thread_config
+from model_config import BACKENDS, INPUT_SHAPE, MODEL_PATH
+
+DEFAULT_BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64, 128]
+DEFAULT_RUNS = 100
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux but bytes on macOS
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def _load(backend, threads):
+    """Load backend without warm-up, overriding the thread count unless threads is 0"""
+    import tensorflow as tf
+    from predictor import CascadePredictor, Predictor, TFLitePredictor
+
+    if backend.startswith('tflite'):
+        return TFLitePredictor(BACKENDS[backend], num_threads=threads or None, warmup=False)
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    if backend == 'cascade':
+        return CascadePredictor(Predictor.from_path(BACKENDS[backend], warmup=False),
+                                Predictor.from_path(MODEL_PATH, warmup=False))
+    return Predictor.from_path(BACKENDS[backend], warmup=False)
+
+
+def run_one(backend, threads, batch_sizes=DEFAULT_BATCH_SIZES, runs=DEFAULT_RUNS):
+    """Measure one backend/thread configuration in the current process"""
+    start = time.perf_counter()
+    thread_profile = thread_config.apply()  # must happen before TensorFlow is imported
+    import tensorflow as tf
+    import_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    predictor = _load(backend, threads)
+    load_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(0)
+    img_array = rng.random((1,) + INPUT_SHAPE, dtype=np.float32)
+    start = time.perf_counter()
+    predictor(img_array)
+    first_inference_s = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        predictor(img_array)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies = np.array(latencies)
+
+    throughput = {}
+    for batch_size in batch_sizes:
+        batch = rng.random((batch_size,) + INPUT_SHAPE, dtype=np.float32)
+        predictor(batch)  # TFLite resizes its tensors on a new batch size
+        repeats = max(3, 256 // batch_size)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            predictor(batch)
+        throughput[batch_size] = batch_size * repeats / (time.perf_counter() - start)
+
+    return {
+        'backend': backend,
+        'threads': threads,
+        'thread_profile': thread_profile,
+        'tensorflow': tf.__version__,
+        'import_s': import_s,
+        'load_s': load_s,
+        'first_inference_s': first_inference_s,
+        'latency_ms': {
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)),
+            'mean': float(latencies.mean()),
+        },
+        'throughput': throughput,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def available_backends():
+    return [backend for backend, path in BACKENDS.items()
+            if os.path.exists(path) and (backend != 'cascade' or os.path.exists(MODEL_PATH))]
+
+
+def run_suite(backends, thread_settings, batch_sizes=DEFAULT_BATCH_SIZES, runs=DEFAULT_RUNS):
+    """Run every backend/thread configuration in its own subprocess and collect the results"""
+    results = []
+    for backend in backends:
+        for threads in thread_settings:
+            print(f"Benchmarking {backend} with threads={threads or 'default'}...", flush=True)
+            command = [sys.executable, __file__, '--run-one', backend, str(threads), '--runs', str(runs),
+                       '--batch-sizes', *map(str, batch_sizes)]
+            process = subprocess.run(command, capture_output=True, text=True)
+            if process.returncode != 0:
+                print(f"  failed: {process.stderr.strip().splitlines()[-1:]}")
+                results.append({'backend': backend, 'threads': threads, 'error': process.stderr[-2000:]})
+                continue
+            result = json.loads(process.stdout.strip().splitlines()[-1])
+            print(f"  p50 {result['latency_ms']['p50']:.2f} ms, "
+                  f"max {max(result['throughput'].values()):.1f} images/sec, "
+                  f"peak RSS {result['peak_rss_mb']:.0f} MB")
+            results.append(result)
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'host': {
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+        },
+        'batch_sizes': batch_sizes,
+        'runs': runs,
+        'results': results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark load time, latency and throughput of every backend")
+    parser.add_argument('--backends', nargs='+', choices=sorted(BACKENDS), help="default: all with a model file")
+    parser.add_argument('--threads', type=int, nargs='+', default=[0, 1, os.cpu_count()])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help="batch-1 latency samples")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--run-one', nargs=2, metavar=('BACKEND', 'THREADS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        backend, threads = args.run_one
+        print(json.dumps(run_one(backend, int(threads), args.batch_sizes, args.runs)))
+    else:
+        thread_settings = list(dict.fromkeys(args.threads))
+        report = run_suite(args.backends or available_backends(), thread_settings, args.batch_sizes, args.runs)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
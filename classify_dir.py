@@ -0,0 +1,161 @@
+"""Classify every image under one or more directory trees.
+
+Paths are streamed from os.walk into a tf.data pipeline that reads and
+decodes files in parallel, batches them and prefetches the next batch while
+the current one runs through the model. Results are written out batch by
+batch, so memory use stays flat however many files there are.
+
+A root can also be a split manifest (see split_manifest), whose listed
+images are classified, or a packed directory (see packed_dataset), which is
+read from its memory-mapped shards and reported under the original paths.
+
+    python classify_dir.py dataset/0 dataset/1 -o predictions.csv
+    python classify_dir.py splits/test.json --backend tflite-int8 -o predictions.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+import thread_config
+thread_config.apply(thread_config.THROUGHPUT)  # before TensorFlow loads, see thread_config
+
+import tensorflow as tf
+
+from model_config import CLASS_NAMES, split_prediction
+from packed_dataset import PackedDataset, is_packed
+from input_pipeline import decode
+from predictor import load_predictor
+from preprocessing import IMAGE_EXTENSIONS
+from split_manifest import is_manifest, load_manifest
+
+DEFAULT_BATCH_SIZE = 32
+
+
+def iter_image_paths(roots):
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(dirpath, filename)
+
+
+def _scaled(path):
+    return path, tf.cast(decode(path), tf.float32) / 255.0
+
+
+def _counted(paths, listed):
+    for path in paths:
+        listed['files'] += 1
+        yield path
+
+
+def _root_dataset(root, batch_size, listed):
+    """(path, image) elements of one image tree or manifest, or of a packed directory's shards
+
+    Files that can't be read or decoded are dropped with a logged warning;
+    listed['files'] counts every file handed to the pipeline, so the caller
+    can tell how many were skipped.
+    """
+    if is_manifest(root):
+        paths = load_manifest(root)[0]
+        listed['files'] += len(paths)
+        paths = tf.data.Dataset.from_tensor_slices(paths)
+    elif is_packed(root):
+        packed = PackedDataset(root)
+        listed['files'] += len(packed.paths)
+        return (packed.dataset(batch_size)
+                .map(lambda paths, img_batch, labels: (paths, tf.cast(img_batch, tf.float32) / 255.0))
+                .unbatch())
+    else:
+        paths = tf.data.Dataset.from_generator(lambda: _counted(iter_image_paths([root]), listed),
+                                               output_signature=tf.TensorSpec(shape=(), dtype=tf.string))
+    return (paths.map(_scaled, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+            .ignore_errors(log_warning=True))
+
+
+def build_dataset(roots, batch_size=DEFAULT_BATCH_SIZE, listed=None):
+    """Batched (paths, images) of every root; listed, if given, counts the files fed in"""
+    listed = listed if listed is not None else {'files': 0}
+    dataset = _root_dataset(roots[0], batch_size, listed)
+    for root in roots[1:]:
+        dataset = dataset.concatenate(_root_dataset(root, batch_size, listed))
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+class ResultWriter:
+    """Streams rows to CSV or JSONL depending on the output file extension"""
+
+    FIELDS = ['path', 'class_index', 'predicted_class', 'emergency_probability']
+
+    def __init__(self, output_path):
+        self.file = open(output_path, 'w', newline='')
+        self.jsonl = output_path.endswith('.jsonl')
+        if not self.jsonl:
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.FIELDS)
+
+    def write(self, paths, probabilities):
+        for path, row in zip(paths, probabilities):
+            emergency_probs, _ = split_prediction(row)
+            class_index = int(np.argmax(emergency_probs))
+            values = [path.decode(), class_index, CLASS_NAMES[class_index], round(float(emergency_probs[1]), 6)]
+            if self.jsonl:
+                self.file.write(json.dumps(dict(zip(self.FIELDS, values))) + '\n')
+            else:
+                self.writer.writerow(values)
+
+    def close(self):
+        self.file.close()
+
+
+def classify(roots, output_path, backend='keras', batch_size=DEFAULT_BATCH_SIZE):
+    predictor = load_predictor(backend)
+    writer = ResultWriter(output_path)
+    timings = {'input': 0.0, 'inference': 0.0, 'write': 0.0}
+    count = 0
+
+    listed = {'files': 0}
+
+    start = time.perf_counter()
+    iterator = iter(build_dataset(roots, batch_size, listed))
+    while True:
+        # Time spent here is time the model waited on the input pipeline
+        t0 = time.perf_counter()
+        try:
+            paths, img_batch = next(iterator)
+        except StopIteration:
+            break
+        t1 = time.perf_counter()
+        probabilities = predictor(img_batch)
+        t2 = time.perf_counter()
+        writer.write(paths.numpy(), probabilities)
+        t3 = time.perf_counter()
+
+        timings['input'] += t1 - t0
+        timings['inference'] += t2 - t1
+        timings['write'] += t3 - t2
+        count += len(probabilities)
+    writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Classified {count} images in {elapsed:.2f}s ({count / elapsed:.1f} images/sec)")
+    if listed['files'] > count:
+        print(f"Skipped {listed['files'] - count} unreadable images, see the warnings above")
+    for stage, seconds in timings.items():
+        print(f"  {stage:<10}{seconds:>8.2f}s  {100 * seconds / elapsed:>5.1f}%")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify all images under one or more directories")
+    parser.add_argument('roots', nargs='+', help="directories to scan recursively, manifests or packed directories")
+    parser.add_argument('-o', '--output', default='predictions.csv', help=".csv or .jsonl")
+    parser.add_argument('--backend', default='keras')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+    classify(args.roots, args.output, args.backend, args.batch_size)
@@ -0,0 +1,196 @@
+"""Distil my_model.keras into a small student for single-core edge CPUs.
+
+The DenseNet121 teacher is far more model than a two-class decision needs.
+The student is a narrow stack of depthwise-separable conv blocks trained on
+the training split against both the true labels and the teacher's softened
+probabilities. If its single-core latency misses --target-ms, the
+pointwise layers are pruned channel-wise (lowest L1 norm first) into a
+narrower model, and that model is fine-tuned with the same loss. This
+repeats until the target is met or --max-prune-rounds is reached.
+
+The result is a plain softmax .keras model taking the usual [0, 1] 224x224
+input. It is saved as my_model_student.keras, which is the 'student'
+backend, and the script prints an accuracy/latency comparison with the
+teacher on the test split.
+
+    python distill.py --epochs 30 --target-ms 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import Input, Model
+from tensorflow.keras.layers import (Activation, BatchNormalization, Conv2D, Dense, DepthwiseConv2D, Dropout,
+                                     GlobalAveragePooling2D, ReLU)
+from tensorflow.keras.models import load_model
+from tensorflow.keras.optimizers import Adam
+
+from input_pipeline import make_dataset
+from model_config import BACKENDS, INPUT_SHAPE, MODEL_PATH
+
+TRAIN_DIR = 'splits/train.json'
+VAL_DIR = 'splits/val.json'
+TEST_DIR = 'splits/test.json'
+STUDENT_MODEL_PATH = BACKENDS['student']
+
+STEM_WIDTH = 16
+# (output channels, stride) of each depthwise-separable block
+DEFAULT_BLOCKS = [(32, 1), (64, 2), (128, 2), (128, 1), (256, 2), (256, 1)]
+
+SINGLE_CORE = {'intra_op_threads': 1, 'inter_op_threads': 1, 'omp_num_threads': 1, 'onednn': True}
+
+
+def build_student(blocks=DEFAULT_BLOCKS, dropout=0.25):
+    """Return (student, logits_model) sharing weights; student ends in softmax like the teacher"""
+    inputs = Input(shape=INPUT_SHAPE)
+    x = Conv2D(STEM_WIDTH, 3, strides=2, padding='same', use_bias=False, name='stem_conv')(inputs)
+    x = BatchNormalization(name='stem_bn')(x)
+    x = ReLU()(x)
+    for i, (width, stride) in enumerate(blocks):
+        x = DepthwiseConv2D(3, strides=stride, padding='same', use_bias=False, name=f'block{i}_dw')(x)
+        x = BatchNormalization(name=f'block{i}_dw_bn')(x)
+        x = ReLU()(x)
+        x = Conv2D(width, 1, use_bias=False, name=f'block{i}_pw')(x)
+        x = BatchNormalization(name=f'block{i}_pw_bn')(x)
+        x = ReLU()(x)
+    x = GlobalAveragePooling2D()(x)
+    x = Dropout(dropout)(x)
+    logits = Dense(2, name='logits')(x)
+    outputs = Activation('softmax')(logits)
+    return Model(inputs, outputs), Model(inputs, logits)
+
+
+def prune_student(student, blocks, keep_fraction):
+    """Return (blocks, student, logits_model) keeping the highest-L1 pointwise channels of every block"""
+    pruned_blocks = [(max(8, int(round(width * keep_fraction))), stride) for width, stride in blocks]
+    pruned, pruned_logits = build_student(pruned_blocks)
+
+    def copy(name, slice_fn):
+        pruned.get_layer(name).set_weights([slice_fn(w) for w in student.get_layer(name).get_weights()])
+
+    copy('stem_conv', lambda w: w)
+    copy('stem_bn', lambda w: w)
+    keep = np.arange(STEM_WIDTH)
+    for i, (width, _) in enumerate(pruned_blocks):
+        # Input channels follow whatever the previous block kept
+        copy(f'block{i}_dw', lambda w: w[:, :, keep, :])
+        copy(f'block{i}_dw_bn', lambda w: w[keep])
+        kernel = student.get_layer(f'block{i}_pw').get_weights()[0][:, :, keep, :]
+        next_keep = np.sort(np.argsort(np.abs(kernel).sum(axis=(0, 1, 2)))[-width:])
+        pruned.get_layer(f'block{i}_pw').set_weights([kernel[:, :, :, next_keep]])
+        copy(f'block{i}_pw_bn', lambda w: w[next_keep])
+        keep = next_keep
+    kernel, bias = student.get_layer('logits').get_weights()
+    pruned.get_layer('logits').set_weights([kernel[keep], bias])
+    return pruned_blocks, pruned, pruned_logits
+
+
+def load_split(directory, batch_size, shuffle):
+    """(images in [0, 1], one-hot labels) batches from a split manifest or class-per-folder tree"""
+    return make_dataset(directory, batch_size, shuffle=shuffle)
+
+
+def distil(teacher, student, logits_model, train_data, val_data, epochs, temperature=4.0, alpha=0.3,
+           learning_rate=1e-3):
+    """Train logits_model on alpha * hard-label CE + (1 - alpha) * T^2 * KL(teacher || student)"""
+    optimizer = Adam(learning_rate=learning_rate)
+    augment = tf.keras.Sequential([tf.keras.layers.RandomFlip('horizontal')])
+
+    @tf.function
+    def train_step(images, labels):
+        images = augment(images, training=True)
+        # Log-probabilities are logits up to a constant, which softmax ignores
+        teacher_logits = tf.math.log(teacher(images, training=False) + 1e-7)
+        soft_targets = tf.nn.softmax(teacher_logits / temperature)
+        with tf.GradientTape() as tape:
+            logits = logits_model(images, training=True)
+            hard_loss = tf.keras.losses.categorical_crossentropy(labels, logits, from_logits=True)
+            soft_loss = tf.reduce_sum(
+                soft_targets * (tf.math.log(soft_targets + 1e-7) - tf.nn.log_softmax(logits / temperature)),
+                axis=-1)
+            loss = tf.reduce_mean(alpha * hard_loss + (1 - alpha) * temperature ** 2 * soft_loss)
+        gradients = tape.gradient(loss, logits_model.trainable_variables)
+        optimizer.apply_gradients(zip(gradients, logits_model.trainable_variables))
+        return loss
+
+    for epoch in range(epochs):
+        losses = [float(train_step(images, labels)) for images, labels in train_data]
+        print(f"Epoch {epoch + 1}/{epochs} - loss: {np.mean(losses):.4f} - "
+              f"val_accuracy: {accuracy(student, val_data):.4f}")
+
+
+def accuracy(model, data):
+    correct = total = 0
+    for images, labels in data:
+        predictions = model(images, training=False).numpy().argmax(axis=1)
+        correct += int(np.sum(predictions == labels.numpy().argmax(axis=1)))
+        total += len(predictions)
+    return correct / total
+
+
+def single_core_latency(model_path, runs=50):
+    """Batch-1 p50 latency in ms of model_path on one thread, measured in a fresh process"""
+    tuner = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tune_threads.py')
+    command = [sys.executable, tuner, '--run-one', json.dumps(SINGLE_CORE), '--model', model_path,
+               '--batch-size', '1', '--runs', str(runs)]
+    process = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(process.stdout.strip().splitlines()[-1])['p50_ms']
+
+
+def compare(models, test_data):
+    """Print accuracy, single-core latency, parameters and file size of each saved model"""
+    print("\n| model | accuracy | 1-core p50 ms | parameters | size MB |")
+    print("|---|---|---|---|---|")
+    for name, path in models:
+        model = load_model(path)
+        print(f"| {name} | {accuracy(model, test_data):.3f} | {single_core_latency(path):.2f} | "
+              f"{model.count_params():,} | {os.path.getsize(path) / 2 ** 20:.1f} |")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distil my_model.keras into a small, fast student")
+    parser.add_argument('--teacher', default=MODEL_PATH)
+    parser.add_argument('--output', default=STUDENT_MODEL_PATH)
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--alpha', type=float, default=0.3, help="weight of the hard-label loss")
+    parser.add_argument('--width', type=float, default=1.0, help="multiplier on the default block widths")
+    parser.add_argument('--target-ms', type=float, default=10.0, help="single-core batch-1 latency target")
+    parser.add_argument('--prune-keep', type=float, default=0.75, help="fraction of channels kept per pruning round")
+    parser.add_argument('--max-prune-rounds', type=int, default=3)
+    parser.add_argument('--finetune-epochs', type=int, default=5)
+    args = parser.parse_args()
+
+    teacher = load_model(args.teacher)
+    teacher.trainable = False
+    train_data = load_split(TRAIN_DIR, args.batch_size, shuffle=True)
+    val_data = load_split(VAL_DIR, args.batch_size, shuffle=False)
+    test_data = load_split(TEST_DIR, args.batch_size, shuffle=False)
+
+    blocks = [(max(8, int(width * args.width)), stride) for width, stride in DEFAULT_BLOCKS]
+    student, logits_model = build_student(blocks)
+    distil(teacher, student, logits_model, train_data, val_data, args.epochs, args.temperature, args.alpha)
+    student.save(args.output)
+
+    latency_ms = single_core_latency(args.output)
+    print(f"Student: {student.count_params():,} parameters, {latency_ms:.2f} ms on one core")
+    for prune_round in range(args.max_prune_rounds):
+        if latency_ms <= args.target_ms:
+            break
+        blocks, student, logits_model = prune_student(student, blocks, args.prune_keep)
+        distil(teacher, student, logits_model, train_data, val_data, args.finetune_epochs,
+               args.temperature, args.alpha, learning_rate=1e-4)
+        student.save(args.output)
+        latency_ms = single_core_latency(args.output)
+        print(f"Pruning round {prune_round + 1}: widths {[width for width, _ in blocks]}, "
+              f"{latency_ms:.2f} ms on one core")
+    if latency_ms > args.target_ms:
+        print(f"Warning: {latency_ms:.2f} ms is still above the {args.target_ms} ms target")
+
+    print(f"Wrote {args.output}")
+    compare([('teacher', args.teacher), ('student', args.output)], test_data)
@@ -1,14 +1,25 @@
+import argparse
+import math
 import pygame
 import sys
 import time
 import numpy as np
 import os
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import filedialog
 from PIL import Image
+from frame_source import FrameSource, StreamClassifier
+from inference_client import InferenceClient
+from inference_queue import InferenceQueue
+from preprocessing import load_image
+from model_config import backend_files, split_prediction
+from motion_gate import MotionGate
+from model_loader import FAILED, LOADING, READY
+from model_registry import ModelRegistry
+from prediction_cache import PredictionCache
+
+STARTUP_TIME = time.perf_counter()
 
 # Initialize pygame
 pygame.init()
@@ -39,15 +50,45 @@ RED_TIME = 60
 GREEN_TIME = 60
 YELLOW_TIME = 5
 
-# Initialize ML model
-try:
-    model = load_model('my_model.keras')
-    model_loaded = True
-    print("ML model loaded successfully!")
-except Exception as e:
-    model_loaded = False
-    print(f"Couldn't load ML model: {e}")
-    print("Simulator will run without ML capabilities")
+# Frame timing
+FPS = 60
+FRAME_BUDGET_MS = 1000 / FPS
+
+# Inference backend (one of model_config.BACKENDS) and batching
+INFERENCE_BACKEND = 'keras'
+INFERENCE_SERVER_URL = 'http://127.0.0.1:8765'  # shared model from inference_server.py, if running
+BATCH_WINDOW_MS = 10
+MAX_BATCH_SIZE = 16
+
+# Prediction cache for re-uploaded images (set a file path to keep it across runs)
+PREDICTION_CACHE_SIZE = 256
+PREDICTION_CACHE_FILE = None
+
+parser = argparse.ArgumentParser(description="Traffic light simulation with emergency vehicle detection")
+parser.add_argument('--video', help="video file or directory of frames to watch for emergency vehicles")
+args = parser.parse_args()
+
+def load_ml_model():
+    # Imported here so TensorFlow itself loads on the background thread
+    from predictor import load_predictor
+    return load_predictor(INFERENCE_BACKEND)
+
+# The ML model loads in the background once the window is up; predictions
+# requested before it is ready wait in the inference queue. A retrained model
+# file is picked up and swapped in without a restart.
+emergency_model = ModelRegistry(load_ml_model, backend_files(INFERENCE_BACKEND), startup_time=STARTUP_TIME)
+# Concurrent requests are batched into a single forward pass
+inference_queue = InferenceQueue(emergency_model,
+                                 batch_window_ms=BATCH_WINDOW_MS,
+                                 max_batch_size=MAX_BATCH_SIZE)
+# Images we have already classified locally skip the model entirely
+prediction_cache = PredictionCache(backend_files(INFERENCE_BACKEND), capacity=PREDICTION_CACHE_SIZE,
+                                   disk_path=PREDICTION_CACHE_FILE, registry=emergency_model)
+inference_client = InferenceClient(emergency_model, inference_queue, url=INFERENCE_SERVER_URL, client_name='ev10',
+                                   cache=prediction_cache)
+
+# Inference runs on a single worker thread so the main loop keeps ticking
+inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
 
 class Car:
     def __init__(self, x, y, speed, is_emergency=False):
@@ -241,11 +282,12 @@ def draw_buttons():
     screen.blit(text, (360, 515))
     
     # Image upload button
-    upload_button_color = (120, 80, 180) if model_loaded else (100, 100, 100)
+    model_usable = inference_client.status != FAILED
+    upload_button_color = (120, 80, 180) if model_usable else (100, 100, 100)
     upload_button = pygame.draw.rect(screen, upload_button_color, (550, 500, 200, 50), border_radius=button_radius)
-    upload_border = (80, 40, 140) if model_loaded else (70, 70, 70)
+    upload_border = (80, 40, 140) if model_usable else (70, 70, 70)
     pygame.draw.rect(screen, upload_border, (550, 500, 200, 50), width=2, border_radius=button_radius)
-    upload_text = "Upload Vehicle Image" if model_loaded else "ML Model Not Loaded"
+    upload_text = "Upload Vehicle Image" if model_usable else "ML Model Not Loaded"
     text = button_font.render(upload_text, True, WHITE)
     screen.blit(text, (565, 515))
     
@@ -254,13 +296,10 @@ def draw_buttons():
 def predict_vehicle_type(image_path):
     """Predict if the image contains an emergency vehicle or normal vehicle"""
     try:
-        img = image.load_img(image_path, target_size=(224, 224))
-        img_array = image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array = img_array / 255.0  # Normalize as in your code
-        
-        prediction = model.predict(img_array)
-        predicted_class_index = np.argmax(prediction)
+        prediction = inference_client.predict(image_path)
+        img = load_image(image_path)  # only needed for the result overlay
+        emergency_probs, _ = split_prediction(prediction)
+        predicted_class_index = np.argmax(emergency_probs)
         
         class_names = ['Normal', 'Emergency Vehicle']
         predicted_class = class_names[predicted_class_index]
@@ -366,9 +405,6 @@ def show_prediction_overlay(predicted_class, img=None):
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if continue_button.collidepoint(event.pos):
                     waiting_for_click = False
-                    # Apply traffic rules based on prediction
-                    if predicted_class == "Emergency Vehicle" and (traffic_light.state == LIGHT_RED or traffic_light.state == LIGHT_YELLOW):
-                        traffic_light.emergency_detected()
 
 def open_file_dialog():
     """Open a file dialog to select an image for prediction"""
@@ -391,12 +427,40 @@ cars = []
 for i in range(3):
     cars.append(Car(-200 - i * 200, 320, 2 + i * 0.5, is_emergency=False))
 
+# Use the inference server, or start loading the model, now that the window is up
+inference_client.start()
+
+# Camera footage is classified in-process, frames never touch the disk
+video_stream = None
+if args.video:
+    video_stream = StreamClassifier(FrameSource(args.video), inference_queue.predict,
+                                    gate=MotionGate()).start()
+
 # Main game loop
 clock = pygame.time.Clock()
+first_frame = True
 running = True
 showing_prediction = False
 last_image_path = None
 
+# Background inference state
+pending_prediction = None
+inference_start_time = 0
+inference_frames = 0
+inference_dropped_frames = 0
+
+def draw_classifying_status():
+    """Show a status box while a prediction is running in the background"""
+    status_bg = pygame.Rect(WIDTH - 360, 190, 340, 40)
+    pygame.draw.rect(screen, (70, 40, 110), status_bg, border_radius=5)
+    pygame.draw.rect(screen, (120, 80, 180), status_bg, width=1, border_radius=5)
+    
+    small_font = pygame.font.SysFont('arial', 18)
+    dots = "." * (1 + (pygame.time.get_ticks() // 300) % 3)
+    elapsed_s = (pygame.time.get_ticks() - inference_start_time) / 1000
+    text = small_font.render(f"Classifying{dots} ({elapsed_s:.1f}s)", True, WHITE)
+    screen.blit(text, (WIDTH - 350, 200))
+
 # Background elements
 def draw_background():
     # Sky gradient
@@ -464,18 +528,45 @@ while running:
                 traffic_light.set_green()
             elif auto_button.collidepoint(mouse_pos):
                 traffic_light.toggle_auto_mode()
-            elif upload_button.collidepoint(mouse_pos) and model_loaded:
+            elif upload_button.collidepoint(mouse_pos) and inference_client.status != FAILED:
                 # Open file dialog to select image
                 image_path = open_file_dialog()
-                if image_path:
+                if image_path and pending_prediction is None:
                     last_image_path = image_path
-                    predicted_class, img = predict_vehicle_type(image_path)
-                    print(f"Predicted: {predicted_class}")
-                    
-                    # Show prediction overlay FIRST, decision logic is in the continue button
-                    showing_prediction = True
-                    show_prediction_overlay(predicted_class, img)
-                    showing_prediction = False
+                    # Run the model off the main thread, the result is picked up below
+                    pending_prediction = inference_executor.submit(predict_vehicle_type, image_path)
+                    inference_start_time = pygame.time.get_ticks()
+                    inference_frames = 0
+                    inference_dropped_frames = 0
+    
+    # Collect a finished background prediction
+    if pending_prediction is not None and pending_prediction.done():
+        predicted_class, img = pending_prediction.result()
+        pending_prediction = None
+        print(f"Predicted: {predicted_class}")
+        
+        # Frames a blocking predict() would have frozen vs. frames actually missed
+        inference_ms = pygame.time.get_ticks() - inference_start_time
+        blocking_dropped_frames = int(inference_ms // FRAME_BUDGET_MS)
+        print(f"Inference took {inference_ms} ms over {inference_frames} frames: "
+              f"dropped {inference_dropped_frames} frames "
+              f"(blocking main thread would drop {blocking_dropped_frames})")
+        
+        showing_prediction = True
+        show_prediction_overlay(predicted_class, img)
+        showing_prediction = False
+        
+        # Apply traffic rules once the overlay is dismissed, so the override
+        # timer doesn't run out while it is open
+        if predicted_class == "Emergency Vehicle" and (traffic_light.state == LIGHT_RED or traffic_light.state == LIGHT_YELLOW):
+            traffic_light.emergency_detected()
+    
+    # Emergency vehicles spotted in the camera footage
+    if video_stream is not None:
+        for frame_index, probability in video_stream.poll():
+            print(f"Emergency vehicle in frame {frame_index} ({probability:.2f})")
+            if traffic_light.state == LIGHT_RED or traffic_light.state == LIGHT_YELLOW:
+                traffic_light.emergency_detected()
     
     # Update
     traffic_light.update()
@@ -538,16 +629,28 @@ while running:
     
     # Show ML status with icon
     ml_bg = pygame.Rect(WIDTH - 220, 70, 200, 60)
-    ml_status_color = (0, 100, 0, 180) if model_loaded else (100, 0, 0, 180)
+    if inference_client.status == LOADING:
+        ml_status_color = (110, 80, 0, 180)
+        ml_status = "ML Model: Warming up"
+    elif inference_client.status == FAILED:
+        ml_status_color = (100, 0, 0, 180)
+        ml_status = "ML Model: Not Loaded"
+    else:
+        ml_status_color = (0, 100, 0, 180)
+        ml_status = "ML Model: Loaded"
     pygame.draw.rect(screen, ml_status_color, ml_bg, border_radius=8)
     pygame.draw.rect(screen, (80, 80, 120), ml_bg, width=2, border_radius=8)
     
-    ml_status = "ML Model: Loaded" if model_loaded else "ML Model: Not Loaded"
     ml_text = legend_font.render(ml_status, True, WHITE)
     screen.blit(ml_text, (WIDTH - 200, 75))
     
     # ML icon
-    if model_loaded:
+    if inference_client.status == LOADING:
+        # Draw spinner while the model warms up
+        angle = (pygame.time.get_ticks() // 100) % 12 * 30
+        spinner_rect = pygame.Rect(WIDTH - 80, 92, 28, 28)
+        pygame.draw.arc(screen, (255, 220, 100), spinner_rect, np.radians(angle), np.radians(angle + 270), 3)
+    elif inference_client.status == READY:
         # Draw brain icon
         brain_color = (100, 255, 100)
         pygame.draw.ellipse(screen, brain_color, (WIDTH - 80, 95, 30, 25))
@@ -571,11 +674,33 @@ while running:
         text = small_font.render(f"Last image: {filename}", True, (220, 220, 255))
         screen.blit(text, (WIDTH - 350, 150))
     
+    if pending_prediction is not None:
+        draw_classifying_status()
+    
     # Draw control buttons
     draw_buttons()
     
     pygame.display.flip()
-    clock.tick(60)
+    if first_frame:
+        print(f"First frame {time.perf_counter() - STARTUP_TIME:.2f}s after startup")
+        first_frame = False
+    frame_ms = clock.tick(FPS)
+    
+    # Count frames that overran their budget while a prediction is in flight;
+    # tick() reports whole milliseconds, so an on-budget frame reads as 16 or 17
+    if pending_prediction is not None:
+        inference_frames += 1
+        inference_dropped_frames += math.ceil(frame_ms / math.ceil(FRAME_BUDGET_MS)) - 1
 
+inference_executor.shutdown(wait=False)
+if video_stream is not None:
+    video_stream.stop()
+    print(f"Video stream stats: {video_stream.stats()}")
+inference_queue.close()
+print(f"Inference queue stats: {inference_queue.stats()}")
+print(f"Prediction cache stats: {prediction_cache.stats()}")
+prediction_cache.close()
+emergency_model.close()
+print(f"Model registry stats: {emergency_model.stats()}")
 pygame.quit()
 sys.exit()
\ No newline at end of file
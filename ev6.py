@@ -1,14 +1,23 @@
+import argparse
 import pygame
 import time
 import random
 import sys
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import filedialog
 from enum import Enum
 from typing import List, Dict, Tuple
-import numpy as np
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
+from frame_source import FrameSource, StreamClassifier
+from inference_client import InferenceClient
+from inference_queue import InferenceQueue
+from model_config import CLASS_NAMES, backend_files, split_prediction
+from motion_gate import MotionGate
+from model_loader import LOADING, FAILED
+from model_registry import ModelRegistry
+from prediction_cache import PredictionCache
+
+STARTUP_TIME = time.perf_counter()
 
 # Initialize Pygame
 pygame.init()
@@ -45,8 +54,33 @@ FONT = pygame.font.Font(None, 36)
 SMALL_FONT = pygame.font.Font(None, 24)
 INFO_FONT = pygame.font.Font(None, 18)
 
-# Load emergency vehicle detection model
-EMERGENCY_MODEL = load_model('my_model.keras')
+# Inference backend (one of model_config.BACKENDS) and batching; 'multitask'
+# also detects the vehicle type, which uploaded vehicles then spawn as
+INFERENCE_BACKEND = 'keras'
+INFERENCE_SERVER_URL = 'http://127.0.0.1:8765'  # shared model from inference_server.py, if running
+BATCH_WINDOW_MS = 10
+MAX_BATCH_SIZE = 16
+
+# Prediction cache for re-uploaded images (set a file path to keep it across runs)
+PREDICTION_CACHE_SIZE = 256
+PREDICTION_CACHE_FILE = None
+
+def load_emergency_model():
+    # Imported here so TensorFlow itself loads on the background thread
+    from predictor import load_predictor
+    return load_predictor(INFERENCE_BACKEND)
+
+# Emergency vehicle detection model, loaded in the background once the window
+# is up; detections requested earlier wait in the queue until it is ready. A
+# retrained model file is picked up and swapped in without a restart.
+EMERGENCY_MODEL = ModelRegistry(load_emergency_model, backend_files(INFERENCE_BACKEND), startup_time=STARTUP_TIME)
+EMERGENCY_QUEUE = InferenceQueue(EMERGENCY_MODEL,
+                                 batch_window_ms=BATCH_WINDOW_MS,
+                                 max_batch_size=MAX_BATCH_SIZE)
+PREDICTION_CACHE = PredictionCache(backend_files(INFERENCE_BACKEND), capacity=PREDICTION_CACHE_SIZE,
+                                   disk_path=PREDICTION_CACHE_FILE, registry=EMERGENCY_MODEL)
+EMERGENCY_CLIENT = InferenceClient(EMERGENCY_MODEL, EMERGENCY_QUEUE, url=INFERENCE_SERVER_URL, client_name='ev6',
+                                   cache=PREDICTION_CACHE)
 
 class Direction(Enum):
     NORTH = 0
@@ -62,10 +96,13 @@ class VehicleType(Enum):
     AMBULANCE = 'ambulance'
 
 class Vehicle:
-    def __init__(self, direction: Direction, is_emergency=False):
+    def __init__(self, direction: Direction, is_emergency=False, vehicle_type=None):
         self.direction = direction
         self.is_emergency = is_emergency
-        self.type = VehicleType.AMBULANCE if is_emergency else random.choice(list(VehicleType))
+        if vehicle_type:
+            self.type = VehicleType(vehicle_type)
+        else:
+            self.type = VehicleType.AMBULANCE if is_emergency else random.choice(list(VehicleType))
         self.size = VEHICLE_SIZES[self.type.value]
         self.speed = random.uniform(5, 7) if is_emergency else random.uniform(3, 5)
         self.max_speed = 7 if is_emergency else 5
@@ -183,9 +220,16 @@ class TrafficLight:
         screen.blit(timer_text, text_rect)
 
 class TrafficSimulation:
-    def __init__(self):
+    def __init__(self, video_source=None):
         self.screen = pygame.display.set_mode(WINDOW_SIZE)
         pygame.display.set_caption("Smart Traffic Simulation")
+        EMERGENCY_CLIENT.start()
+        # Camera footage is classified in-process, frames never touch the disk
+        self.stream = None
+        if video_source:
+            self.stream = StreamClassifier(FrameSource(video_source), EMERGENCY_QUEUE.predict,
+                                           gate=MotionGate()).start()
+        self.first_frame = True
         
         self.clock = pygame.time.Clock()
         self.vehicles = []
@@ -205,13 +249,16 @@ class TrafficSimulation:
         self.image_button_rect = pygame.Rect(WINDOW_SIZE[0] - 150, 150, 120, 40)
         self.image_path = None
         self.uploaded_image = None
+        # Uploads are classified on a worker thread, so the window keeps running
+        # while the model loads or the prediction runs
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self.pending_upload = None  # (future, file path)
 
     def detect_emergency(self, image_path):
-        img = image.load_img(image_path, target_size=(224, 224))
-        img_array = image.img_to_array(img) / 255.0
-        img_array = np.expand_dims(img_array, axis=0)
-        prediction = EMERGENCY_MODEL.predict(img_array)
-        return prediction[0][0] > 0.5  # Assuming binary classification
+        """Return (is_emergency, vehicle type name or None) from one forward pass"""
+        prediction = EMERGENCY_CLIENT.predict(image_path)
+        emergency_probs, vehicle_type = split_prediction(prediction)
+        return emergency_probs[CLASS_NAMES.index('Emergency Vehicle')] > 0.5, vehicle_type
 
     def update_lights(self):
         # Emergency override system
@@ -236,10 +283,10 @@ class TrafficSimulation:
             for direction in [Direction.EAST, Direction.WEST]:
                 self.lights[direction].color = GREEN
 
-    def spawn_vehicle(self, is_emergency=False, direction=None):
+    def spawn_vehicle(self, is_emergency=False, direction=None, vehicle_type=None):
         if not direction:
             direction = random.choice(list(Direction))
-        self.vehicles.append(Vehicle(direction, is_emergency))
+        self.vehicles.append(Vehicle(direction, is_emergency, vehicle_type))
         if is_emergency:
             self.emergency_vehicles.append(self.vehicles[-1])
 
@@ -339,15 +386,31 @@ class TrafficSimulation:
         self.screen.blit(button_text, (self.button_rect.centerx - button_text.get_width()//2, 
                                      self.button_rect.centery - button_text.get_height()//2))
 
-        pygame.draw.rect(self.screen, (255, 165, 0), self.image_button_rect)
+        # Uploads made while the model warms up wait for it; only a failed load disables them
+        upload_color = (255, 165, 0) if EMERGENCY_CLIENT.status != FAILED else (120, 120, 120)
+        pygame.draw.rect(self.screen, upload_color, self.image_button_rect)
         upload_button_text = FONT.render("Upload Image", True, (255, 255, 255))
         self.screen.blit(upload_button_text, (self.image_button_rect.centerx - upload_button_text.get_width()//2,
                                             self.image_button_rect.centery - upload_button_text.get_height()//2))
 
+        if self.pending_upload is not None:
+            dots = "." * (1 + (pygame.time.get_ticks() // 300) % 3)
+            model_text = INFO_FONT.render(f"Classifying{dots}", True, BLACK)
+            self.screen.blit(model_text, (self.image_button_rect.x, self.image_button_rect.bottom + 5))
+        elif EMERGENCY_CLIENT.status == LOADING:
+            model_text = INFO_FONT.render("Model warming up...", True, BLACK)
+            self.screen.blit(model_text, (self.image_button_rect.x, self.image_button_rect.bottom + 5))
+        elif EMERGENCY_CLIENT.status == FAILED:
+            model_text = INFO_FONT.render("Model not loaded", True, RED)
+            self.screen.blit(model_text, (self.image_button_rect.x, self.image_button_rect.bottom + 5))
+
         if self.uploaded_image:
             self.screen.blit(self.uploaded_image, (WINDOW_SIZE[0] - 180, 200))
 
         pygame.display.flip()
+        if self.first_frame:
+            print(f"First frame {time.perf_counter() - STARTUP_TIME:.2f}s after startup")
+            self.first_frame = False
 
     def run(self):
         running = True
@@ -365,23 +428,48 @@ class TrafficSimulation:
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     if self.button_rect.collidepoint(event.pos):
                         self.ns_green = not self.ns_green
-                    if self.image_button_rect.collidepoint(event.pos):
+                    if (self.image_button_rect.collidepoint(event.pos) and EMERGENCY_CLIENT.status != FAILED
+                            and self.pending_upload is None):
                         file_path = filedialog.askopenfilename()
                         if file_path:
-                            try:
-                                is_emergency = self.detect_emergency(file_path)
-                                direction = random.choice(list(Direction))
-                                self.spawn_vehicle(is_emergency, direction)
-                                self.uploaded_image = pygame.image.load(file_path)
-                            except Exception as e:
-                                print(f"Error loading image: {e}")
+                            self.pending_upload = (self.executor.submit(self.detect_emergency, file_path), file_path)
+
+            # Spawn the uploaded vehicle once its background prediction is done
+            if self.pending_upload is not None and self.pending_upload[0].done():
+                future, file_path = self.pending_upload
+                self.pending_upload = None
+                try:
+                    is_emergency, vehicle_type = future.result()
+                    direction = random.choice(list(Direction))
+                    self.spawn_vehicle(is_emergency, direction, vehicle_type)
+                    self.uploaded_image = pygame.image.load(file_path)
+                except Exception as e:
+                    print(f"Error loading image: {e}")
+
+            if self.stream:
+                for frame_index, probability in self.stream.poll():
+                    print(f"Emergency vehicle in frame {frame_index} ({probability:.2f})")
+                    self.spawn_vehicle(is_emergency=True)
             
             self.draw()
             self.clock.tick(60)
         
+        if self.stream:
+            self.stream.stop()
+            print(f"Video stream stats: {self.stream.stats()}")
+        self.executor.shutdown(wait=False)
+        EMERGENCY_QUEUE.close()
+        print(f"Inference queue stats: {EMERGENCY_QUEUE.stats()}")
+        print(f"Prediction cache stats: {PREDICTION_CACHE.stats()}")
+        PREDICTION_CACHE.close()
+        EMERGENCY_MODEL.close()
+        print(f"Model registry stats: {EMERGENCY_MODEL.stats()}")
         pygame.quit()
         sys.exit()
 
 if __name__ == "__main__":
-    sim = TrafficSimulation()
+    parser = argparse.ArgumentParser(description="Smart traffic simulation")
+    parser.add_argument('--video', help="video file or directory of frames to watch for emergency vehicles")
+    args = parser.parse_args()
+    sim = TrafficSimulation(args.video)
     sim.run()
\ No newline at end of file
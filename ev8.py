@@ -3,12 +3,17 @@ import sys
 import time
 import numpy as np
 import os
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import filedialog
 from PIL import Image
+from inference_client import InferenceClient
+from inference_queue import InferenceQueue
+from preprocessing import load_image
+from model_config import split_prediction
+from model_loader import BackgroundModel, FAILED, LOADING
+
+STARTUP_TIME = time.perf_counter()
 
 # Initialize pygame
 pygame.init()
@@ -32,15 +37,29 @@ LIGHT_RED = 0
 LIGHT_YELLOW = 1
 LIGHT_GREEN = 2
 
-# Initialize ML model
-try:
-    model = load_model('my_model.keras')
-    model_loaded = True
-    print("ML model loaded successfully!")
-except Exception as e:
-    model_loaded = False
-    print(f"Couldn't load ML model: {e}")
-    print("Simulator will run without ML capabilities")
+# Inference backend (one of model_config.BACKENDS) and batching
+INFERENCE_BACKEND = 'keras'
+INFERENCE_SERVER_URL = 'http://127.0.0.1:8765'  # shared model from inference_server.py, if running
+BATCH_WINDOW_MS = 10
+MAX_BATCH_SIZE = 16
+
+def load_ml_model():
+    # Imported here so TensorFlow itself loads on the background thread
+    from predictor import load_predictor
+    return load_predictor(INFERENCE_BACKEND)
+
+# The ML model loads in the background once the window is up; predictions
+# requested before it is ready wait in the inference queue
+emergency_model = BackgroundModel(load_ml_model, startup_time=STARTUP_TIME)
+# Concurrent requests are batched into a single forward pass
+inference_queue = InferenceQueue(emergency_model,
+                                 batch_window_ms=BATCH_WINDOW_MS,
+                                 max_batch_size=MAX_BATCH_SIZE)
+inference_client = InferenceClient(emergency_model, inference_queue, url=INFERENCE_SERVER_URL, client_name='ev8')
+
+# Uploads are classified on a worker thread, so the window keeps running
+# while the model loads or the prediction runs
+inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
 
 class Car:
     def __init__(self, x, y, speed, is_emergency=False):
@@ -190,10 +209,11 @@ def draw_buttons():
     text = font.render(auto_text, True, BLACK)
     screen.blit(text, (360, 515))
     
-    # Image upload button
-    upload_button_color = (150, 100, 200) if model_loaded else (100, 100, 100)
+    # Image upload button; uploads made while the model warms up wait for it
+    model_usable = inference_client.status != FAILED
+    upload_button_color = (150, 100, 200) if model_usable else (100, 100, 100)
     upload_button = pygame.draw.rect(screen, upload_button_color, (550, 500, 200, 50), border_radius=10)
-    upload_text = "Upload Vehicle Image" if model_loaded else "ML Model Not Loaded"
+    upload_text = "Upload Vehicle Image" if model_usable else "ML Model Not Loaded"
     text = font.render(upload_text, True, WHITE)
     screen.blit(text, (565, 515))
     
@@ -202,13 +222,10 @@ def draw_buttons():
 def predict_vehicle_type(image_path):
     """Predict if the image contains an emergency vehicle or normal vehicle"""
     try:
-        img = image.load_img(image_path, target_size=(224, 224))
-        img_array = image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array = img_array / 255.0  # Normalize as in your code
-        
-        prediction = model.predict(img_array)
-        predicted_class_index = np.argmax(prediction)
+        prediction = inference_client.predict(image_path)
+        img = load_image(image_path)
+        emergency_probs, _ = split_prediction(prediction)
+        predicted_class_index = np.argmax(emergency_probs)
         
         class_names = ['Normal', 'Emergency Vechicle']
         predicted_class = class_names[predicted_class_index]
@@ -304,11 +321,16 @@ cars = []
 for i in range(3):
     cars.append(Car(-200 - i * 200, 320, 2 + i * 0.5, is_emergency=False))
 
+# Use the inference server, or start loading the model, now that the window is up
+inference_client.start()
+
 # Main game loop
 clock = pygame.time.Clock()
+first_frame = True
 running = True
 showing_prediction = False
 last_image_path = None
+pending_prediction = None
 
 while running:
     for event in pygame.event.get():
@@ -328,22 +350,29 @@ while running:
                 traffic_light.set_green()
             elif auto_button.collidepoint(mouse_pos):
                 traffic_light.toggle_auto_mode()
-            elif upload_button.collidepoint(mouse_pos) and model_loaded:
+            elif upload_button.collidepoint(mouse_pos) and inference_client.status != FAILED:
                 # Open file dialog to select image
                 image_path = open_file_dialog()
-                if image_path:
+                if image_path and pending_prediction is None:
                     last_image_path = image_path
-                    predicted_class, img = predict_vehicle_type(image_path)
-                    print(f"Predicted: {predicted_class}")
-                    
-                    # Apply traffic rules based on prediction
-                    if predicted_class == "Emergency Vechicle" and traffic_light.state == LIGHT_RED:
-                        traffic_light.emergency_detected()
-                    
-                    # Show prediction overlay
-                    showing_prediction = True
-                    show_prediction_overlay(predicted_class, img)
-                    showing_prediction = False
+                    # Classified off the main thread, the result is picked up below
+                    pending_prediction = inference_executor.submit(predict_vehicle_type, image_path)
+    
+    # Collect a finished background prediction
+    if pending_prediction is not None and pending_prediction.done():
+        predicted_class, img = pending_prediction.result()
+        pending_prediction = None
+        print(f"Predicted: {predicted_class}")
+        
+        # Show prediction overlay
+        showing_prediction = True
+        show_prediction_overlay(predicted_class, img)
+        showing_prediction = False
+        
+        # Apply traffic rules once the overlay is dismissed, so the override
+        # timer doesn't run out while it is open
+        if predicted_class == "Emergency Vechicle" and traffic_light.state == LIGHT_RED:
+            traffic_light.emergency_detected()
     
     # Update
     traffic_light.update()
@@ -384,8 +413,13 @@ while running:
     screen.blit(green_text, (20, 130))
     
     # Show ML status
-    ml_status = "ML Model: Loaded" if model_loaded else "ML Model: Not Loaded"
-    ml_text = font.render(ml_status, True, (0, 100, 0) if model_loaded else (150, 0, 0))
+    if inference_client.status == LOADING:
+        ml_status, ml_color = "ML Model: Warming up...", (150, 100, 0)
+    elif inference_client.status == FAILED:
+        ml_status, ml_color = "ML Model: Not Loaded", (150, 0, 0)
+    else:
+        ml_status, ml_color = "ML Model: Loaded", (0, 100, 0)
+    ml_text = font.render(ml_status, True, ml_color)
     screen.blit(ml_text, (WIDTH - 200, 70))
     
     # Draw control buttons
@@ -400,8 +434,20 @@ while running:
         text = font.render(f"Last image: {filename}", True, BLACK)
         screen.blit(text, (WIDTH - 300, 100))
     
+    if pending_prediction is not None:
+        font = pygame.font.SysFont(None, 20)
+        dots = "." * (1 + (pygame.time.get_ticks() // 300) % 3)
+        text = font.render(f"Classifying{dots}", True, BLACK)
+        screen.blit(text, (WIDTH - 300, 120))
+    
     pygame.display.flip()
+    if first_frame:
+        print(f"First frame {time.perf_counter() - STARTUP_TIME:.2f}s after startup")
+        first_frame = False
     clock.tick(60)
 
+inference_executor.shutdown(wait=False)
+inference_queue.close()
+print(f"Inference queue stats: {inference_queue.stats()}")
 pygame.quit()
 sys.exit()
\ No newline at end of file
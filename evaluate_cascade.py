@@ -0,0 +1,66 @@
+"""Accuracy, latency and escalation rate of the MobileNetV2 -> DenseNet121 cascade.
+
+Runs every image in the test split through the screening model alone, the
+full model alone, and the cascade at each uncertainty band, one image at a
+time as the simulators do, and prints a markdown table.
+
+    python evaluate_cascade.py --band 0.2 0.8 --band 0.1 0.9
+"""
+import argparse
+import time
+
+import numpy as np
+
+from export_tflite import TEST_DIR, load_image_array
+from model_config import CASCADE_BAND, MODEL_PATH, SCREEN_MODEL_PATH, split_prediction
+from predictor import CascadePredictor, Predictor
+from split_manifest import list_images
+
+
+def _run(predictor, img_arrays):
+    predictions = []
+    latencies = []
+    for img_array in img_arrays:
+        start = time.perf_counter()
+        predictions.append(np.argmax(split_prediction(predictor(img_array)[0])[0]))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(predictions), np.array(latencies)
+
+
+def evaluate_cascade(test_dir=TEST_DIR, bands=(CASCADE_BAND,), screen_path=SCREEN_MODEL_PATH,
+                     expert_path=MODEL_PATH):
+    """Print accuracy, mean/p95 latency and escalation rate per configuration"""
+    paths, labels, _ = list_images(test_dir)
+    img_arrays = [load_image_array(path) for path in paths]
+
+    screen = Predictor.from_path(screen_path)
+    expert = Predictor.from_path(expert_path)
+
+    rows = []
+    for name, predictor in [('screen only', screen), ('full model only', expert)]:
+        predictions, latencies = _run(predictor, img_arrays)
+        rows.append((name, np.mean(predictions == labels), latencies.mean(),
+                     np.percentile(latencies, 95), 1.0 if predictor is expert else 0.0))
+    for band in bands:
+        cascade = CascadePredictor(screen, expert, band=tuple(band))
+        predictions, latencies = _run(cascade, img_arrays)
+        rows.append((f"cascade {band[0]:.2f}-{band[1]:.2f}", np.mean(predictions == labels),
+                     latencies.mean(), np.percentile(latencies, 95), cascade.escalation_rate))
+
+    print(f"\n{len(paths)} images from {test_dir}\n")
+    print("| configuration | accuracy | mean ms | p95 ms | escalated |")
+    print("|---|---|---|---|---|")
+    for name, accuracy, mean_ms, p95_ms, escalated in rows:
+        print(f"| {name} | {accuracy:.3f} | {mean_ms:.2f} | {p95_ms:.2f} | {escalated:.1%} |")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the two-stage cascade against the test split")
+    parser.add_argument('--test-dir', default=TEST_DIR)
+    parser.add_argument('--band', type=float, nargs=2, action='append', metavar=('LOW', 'HIGH'),
+                        help="uncertainty band to escalate on, repeatable")
+    parser.add_argument('--screen-model', default=SCREEN_MODEL_PATH)
+    parser.add_argument('--model', default=MODEL_PATH)
+    args = parser.parse_args()
+    evaluate_cascade(args.test_dir, args.band or [CASCADE_BAND], args.screen_model, args.model)
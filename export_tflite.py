@@ -0,0 +1,110 @@
+"""Export my_model.keras to TFLite for the CPU-only intersection boxes.
+
+Writes two models next to the Keras one:
+
+* my_model_fp16.tflite - float16 weights, float32 inputs and compute
+* my_model_int8.tflite - full-integer int8 model calibrated on the val split
+
+With ``--evaluate`` it then prints an accuracy/latency table for every
+backend in predictor.BACKENDS against the test split.
+
+    python export_tflite.py --evaluate
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+
+from model_config import split_prediction
+from predictor import BACKENDS, MODEL_PATH, load_predictor
+from preprocessing import preprocess_image
+from split_manifest import list_images
+
+CALIBRATION_DIR = 'splits/val.json'
+TEST_DIR = 'splits/test.json'
+
+
+def load_image_array(image_path):
+    """(1, 224, 224, 3) float32 input preprocessed exactly as at inference time"""
+    return preprocess_image(image_path)[1].copy()
+
+
+def export_fp16(model, output_path):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def export_int8(model, output_path, calibration_dir=CALIBRATION_DIR, max_samples=200):
+    calibration_paths = list_images(calibration_dir)[0][:max_samples]
+    if not calibration_paths:
+        raise ValueError(f"No calibration images found under {calibration_dir}")
+
+    def representative_dataset():
+        for path in calibration_paths:
+            yield [load_image_array(path)]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def evaluate_backends(test_dir=TEST_DIR, backends=None):
+    """Print accuracy, batch-1 latency and file size of each available backend on test_dir"""
+    paths, labels, _ = list_images(test_dir)
+    img_arrays = [load_image_array(path) for path in paths]
+
+    rows = []
+    for backend in backends or BACKENDS:
+        model_path = BACKENDS[backend]
+        if not os.path.exists(model_path):
+            print(f"Skipping {backend}: {model_path} not found")
+            continue
+        predictor = load_predictor(backend)
+
+        predictions = []
+        latencies = []
+        for img_array in img_arrays:
+            start = time.perf_counter()
+            predictions.append(np.argmax(split_prediction(predictor(img_array)[0])[0]))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        accuracy = np.mean(np.array(predictions) == labels)
+        size_mb = os.path.getsize(model_path) / 2 ** 20
+        rows.append((backend, accuracy, np.mean(latencies), np.percentile(latencies, 95), size_mb))
+
+    print(f"\n{len(paths)} images from {test_dir}\n")
+    print("| backend | accuracy | mean ms | p95 ms | size MB |")
+    print("|---|---|---|---|---|")
+    for backend, accuracy, mean_ms, p95_ms, size_mb in rows:
+        print(f"| {backend} | {accuracy:.3f} | {mean_ms:.2f} | {p95_ms:.2f} | {size_mb:.1f} |")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export my_model.keras to float16 and int8 TFLite")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--calibration-dir', default=CALIBRATION_DIR)
+    parser.add_argument('--calibration-samples', type=int, default=200)
+    parser.add_argument('--evaluate', action='store_true', help=f"compare all backends on {TEST_DIR}")
+    parser.add_argument('--test-dir', default=TEST_DIR)
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    export_fp16(model, BACKENDS['tflite-fp32'])
+    print(f"Wrote {BACKENDS['tflite-fp32']}")
+    export_int8(model, BACKENDS['tflite-int8'], args.calibration_dir, args.calibration_samples)
+    print(f"Wrote {BACKENDS['tflite-int8']}")
+
+    if args.evaluate:
+        evaluate_backends(args.test_dir)
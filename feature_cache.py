@@ -0,0 +1,254 @@
+"""Cached frozen-backbone features for training and evaluating the head.
+
+The DenseNet121 backbone is frozen, so its pooled embedding of an image
+never changes. Even so, model.fit runs the backbone again on every image
+in every epoch. FeatureCache runs the backbone (everything up to the global
+average pool) once per image and stores the result. It also stores K
+augmented variants of each training image, made with the training
+pipeline's rotation/zoom/shift/flip augmentation. head_model() then trains
+the Dense head on these vectors. The head shares its layers with the full
+model, so after training, model is ready to save as it is.
+
+Features are stored per backbone version, which is a SHA-256 over the
+backbone's weights. Each variant is a memory-mapped float32 .npy with one
+row per image, plus a .keys.npy listing the SHA-256 of the image file
+behind every row:
+
+    feature_cache/<version>/plain.npy, plain.keys.npy
+    feature_cache/<version>/aug1.npy, aug1.keys.npy, ...
+
+Images already in a store are never recomputed. New images are appended.
+Changing the backbone weights starts a fresh version directory.
+
+Run ``python feature_cache.py [data_dir]`` to time extraction and head
+training against fitting the full model, and to check that the head on
+cached features gives the model's predictions.
+"""
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import Input, Model
+from tensorflow.keras.layers import Dropout, GlobalAveragePooling2D
+from tensorflow.keras.models import load_model
+from tensorflow.keras.optimizers import Adam
+
+from input_pipeline import augment, decode, list_split, make_dataset, train_epochs
+from model_config import MODEL_PATH
+from prediction_cache import hash_file
+from split_manifest import SPLITS_DIR, split_path
+
+DEFAULT_CACHE_DIR = 'feature_cache'
+DEFAULT_AUGMENTATIONS = 4
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_SEED = 46
+
+
+def model_version(model):
+    """SHA-256 over a model's weights, in layer order"""
+    h = hashlib.sha256()
+    for weight in model.get_weights():
+        h.update(str(weight.shape).encode())
+        h.update(np.ascontiguousarray(weight).tobytes())
+    return h.hexdigest()
+
+
+def _pool_layer(model):
+    return next(layer for layer in model.layers if isinstance(layer, GlobalAveragePooling2D))
+
+
+def backbone_of(model):
+    """Model from model's input to its pooled backbone embedding"""
+    return Model(model.input, _pool_layer(model).output)
+
+
+def head_model(model):
+    """Model from a pooled embedding to model's output, sharing the layers after the pool
+
+    Dropout in front of the pool is moved behind it, since cached features
+    are already pooled.
+    """
+    pool = _pool_layer(model)
+    after = model.layers[model.layers.index(pool) + 1:]
+    dropout = next((layer for layer in model.layers if isinstance(layer, Dropout)), None)
+    features = Input(shape=pool.output.shape[1:])
+    x = Dropout(dropout.rate)(features) if dropout is not None and dropout not in after else features
+    for layer in after:
+        x = layer(x)
+    return Model(features, x)
+
+
+class FeatureStore:
+    """One variant's memory-mapped (rows, dim) features and the image hash of every row"""
+
+    def __init__(self, path):
+        self.path = path
+        self.keys_path = path[:-len('.npy')] + '.keys.npy'
+        if os.path.exists(path) and os.path.exists(self.keys_path):
+            self.features = np.load(path, mmap_mode='r')
+            keys = np.load(self.keys_path)
+        else:
+            self.features = None
+            keys = np.array([], dtype='<U64')
+        self.index = {key: row for row, key in enumerate(keys)}
+
+    def missing(self, keys):
+        return [key for key in dict.fromkeys(keys) if key not in self.index]
+
+    def append(self, keys, features):
+        """Write old rows plus features for keys to a new file and swap it in"""
+        start = len(self.index)
+        total = start + len(keys)
+        tmp_path = self.path + '.tmp.npy'
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(total, features.shape[1]))
+        if start:
+            out[:start] = self.features
+        out[start:] = features
+        out.flush()
+        del out
+        all_keys = np.array(list(self.index) + list(keys), dtype='<U64')
+        np.save(self.keys_path + '.tmp.npy', all_keys)
+        os.replace(tmp_path, self.path)
+        os.replace(self.keys_path + '.tmp.npy', self.keys_path)
+        self.features = np.load(self.path, mmap_mode='r')
+        self.index = {key: row for row, key in enumerate(all_keys)}
+
+    def get(self, keys):
+        return self.features[[self.index[key] for key in keys]]
+
+
+class FeatureCache:
+    def __init__(self, backbone, cache_dir=DEFAULT_CACHE_DIR, batch_size=DEFAULT_BATCH_SIZE, seed=DEFAULT_SEED):
+        self.backbone = backbone
+        self.batch_size = batch_size
+        self.seed = seed
+        self.version = model_version(backbone)
+        self.directory = os.path.join(cache_dir, self.version[:16])
+        os.makedirs(self.directory, exist_ok=True)
+        self._stores = {}
+        self._hashes = {}
+        self._embed = tf.function(lambda x: backbone(x, training=False))
+
+        # Counters
+        self.computed = 0
+        self.reused = 0
+
+    @classmethod
+    def from_model(cls, model, cache_dir=DEFAULT_CACHE_DIR, **kwargs):
+        """Cache the pooled embeddings of a full classifier's backbone"""
+        return cls(backbone_of(model), cache_dir, **kwargs)
+
+    def _store(self, variant):
+        if variant not in self._stores:
+            name = 'plain' if variant == 0 else f'aug{variant}'
+            self._stores[variant] = FeatureStore(os.path.join(self.directory, f'{name}.npy'))
+        return self._stores[variant]
+
+    def _hash(self, path):
+        if path not in self._hashes:
+            self._hashes[path] = hash_file(path)
+        return self._hashes[path]
+
+    def _extract(self, paths, variant):
+        """Backbone embeddings of paths; variant k > 0 uses the k-th augmentation seed"""
+        dataset = tf.data.Dataset.from_tensor_slices(paths)
+        dataset = dataset.map(decode, num_parallel_calls=tf.data.AUTOTUNE).batch(self.batch_size)
+        if variant:
+            # Stateless seed per variant and batch, so every image gets its own draw
+            variant_seed = tf.constant(self.seed + variant, tf.int64)
+            dataset = dataset.enumerate().map(
+                lambda index, x: augment(tf.cast(x, tf.float32), tf.stack([variant_seed, index])) / 255.0,
+                num_parallel_calls=tf.data.AUTOTUNE)
+        else:
+            dataset = dataset.map(lambda x: tf.cast(x, tf.float32) / 255.0, num_parallel_calls=tf.data.AUTOTUNE)
+        batches = [self._embed(images).numpy() for images in dataset.prefetch(tf.data.AUTOTUNE)]
+        return np.concatenate(batches).astype(np.float32)
+
+    def features(self, paths, variant=0):
+        """(len(paths), dim) embeddings of image files, computing only those not cached yet"""
+        keys = [self._hash(path) for path in paths]
+        store = self._store(variant)
+        missing = store.missing(keys)
+        if missing:
+            first_path = dict(zip(keys, paths))
+            store.append(missing, self._extract([first_path[key] for key in missing], variant))
+        self.computed += len(missing)
+        self.reused += len(keys) - len(missing)
+        return store.get(keys)
+
+    def split(self, directory, augmentations=0):
+        """(features, integer labels) for a class-per-folder tree, with augmented copies appended"""
+        paths, labels, _ = list_split(directory)
+        features = [self.features(paths, variant) for variant in range(augmentations + 1)]
+        return np.concatenate(features), np.tile(labels, augmentations + 1)
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'computed': self.computed,
+            'reused': self.reused,
+        }
+
+
+def one_hot(labels, classes=2):
+    return np.eye(classes, dtype=np.float32)[labels]
+
+
+def benchmark(data_dir, model_path=MODEL_PATH, augmentations=DEFAULT_AUGMENTATIONS, epochs=20,
+              cache_dir=DEFAULT_CACHE_DIR):
+    """Compare head training on cached features with fitting the whole model on images"""
+    train_dir, val_dir, test_dir = (split_path(data_dir, split) for split in ('train', 'val', 'test'))
+    model = load_model(model_path)
+    cache = FeatureCache.from_model(model, cache_dir)
+    print(f"Backbone version {cache.version[:12]}, features in {cache.directory}")
+
+    timings = {}
+    for attempt in ('extract (cold)', 'extract (cached)'):
+        start = time.perf_counter()
+        train_x, train_y = cache.split(train_dir, augmentations)
+        val_x, val_y = cache.split(val_dir)
+        test_x, test_y = cache.split(test_dir)
+        timings[attempt] = time.perf_counter() - start
+
+    head = head_model(model)
+    head.compile(loss='categorical_crossentropy', optimizer=Adam(learning_rate=0.001), metrics=['accuracy'])
+    start = time.perf_counter()
+    head.fit(train_x, one_hot(train_y), epochs=epochs, batch_size=DEFAULT_BATCH_SIZE,
+             validation_data=(val_x, one_hot(val_y)), verbose=0)
+    timings[f'head fit, {epochs} epochs'] = time.perf_counter() - start
+    start = time.perf_counter()
+    test_accuracy = np.mean(head.predict(test_x, verbose=0).argmax(axis=1) == test_y)
+    timings['head evaluate test'] = time.perf_counter() - start
+
+    # The head shares its Dense layers with model, so model now predicts with the trained head
+    paths = list_split(test_dir)[0]
+    images = np.stack([decode(path).numpy() for path in paths]).astype(np.float32) / 255.0
+    max_diff = float(np.abs(model.predict(images, verbose=0) - head.predict(test_x, verbose=0)).max())
+
+    full_epochs = train_epochs(model_path, make_dataset(train_dir, training=True), make_dataset(val_dir), 2)
+    timings[f'full model fit, {epochs} epochs (epoch 2 x {epochs})'] = full_epochs[-1] * epochs
+
+    print(f"\n{len(train_y) // (augmentations + 1)} training images x {augmentations + 1} variants, "
+          f"{len(val_y)} val, {len(test_y)} test")
+    print("| stage | seconds |")
+    print("|---|---|")
+    for stage, seconds in timings.items():
+        print(f"| {stage} | {seconds:.2f} |")
+    print(f"\nHead test accuracy {test_accuracy:.3f}; max |model - head on cached features| {max_diff:.2e}")
+    print(f"Cache: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time head training on cached backbone features")
+    parser.add_argument('data_dir', nargs='?', default=SPLITS_DIR,
+                        help="folder with train/val/test manifests, or train/, val/ and test/ trees")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--augmentations', type=int, default=DEFAULT_AUGMENTATIONS,
+                        help="augmented variants cached per training image")
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+    benchmark(args.data_dir, args.model, args.augmentations, args.epochs, args.cache_dir)
@@ -0,0 +1,207 @@
+"""Camera-footage ingestion for the emergency vehicle classifier.
+
+FrameSource decodes a local video file (via OpenCV) or a directory of frame
+images on its own thread, paced to the source frame rate, into a fixed-size
+ring buffer. StreamClassifier pulls from that buffer at a configurable rate
+and always takes the newest frame, so when inference falls behind the stale
+frames are skipped rather than queued up. Detections are posted to a queue
+that the simulator's main loop drains.
+"""
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from preprocessing import TARGET_SIZE, BatchBuffer, list_image_paths, load_image
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+DEFAULT_BUFFER_SIZE = 8
+DEFAULT_FRAME_RATE = 10
+DEFAULT_CLASSIFY_RATE = 2
+EMERGENCY_THRESHOLD = 0.5
+
+
+class RingBuffer:
+    """Fixed-capacity frame buffer; when full the oldest frame is overwritten"""
+
+    def __init__(self, capacity=DEFAULT_BUFFER_SIZE):
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self.written = 0
+        self.overwritten = 0
+
+    def put(self, item):
+        with self._lock:
+            if self._count == self.capacity:
+                self.overwritten += 1
+            else:
+                self._count += 1
+            self._slots[self._next] = item
+            self._next = (self._next + 1) % self.capacity
+            self.written += 1
+
+    def take_latest(self):
+        """Return the newest item and discard everything older, or None if empty"""
+        with self._lock:
+            if self._count == 0:
+                return None
+            item = self._slots[(self._next - 1) % self.capacity]
+            self._slots = [None] * self.capacity
+            self._count = 0
+            return item
+
+
+class FrameSource:
+    """Decodes frames from a video file or image directory into a RingBuffer"""
+
+    def __init__(self, source, buffer_size=DEFAULT_BUFFER_SIZE, frame_rate=None, loop=False):
+        self.source = source
+        self.buffer = RingBuffer(buffer_size)
+        self.frame_rate = frame_rate
+        self.loop = loop
+        self.finished = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="frame-decoder", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _frames(self):
+        """Yield (frame_rate, 224x224 RGB uint8 frame) from the source"""
+        if os.path.isdir(self.source):
+            for path in list_image_paths(self.source):
+                yield self.frame_rate or DEFAULT_FRAME_RATE, np.asarray(load_image(path))
+            return
+
+        if cv2 is None:
+            raise ImportError("Reading video files needs OpenCV (pip install opencv-python)")
+        capture = cv2.VideoCapture(self.source)
+        if not capture.isOpened():
+            raise ValueError(f"Couldn't open video {self.source}")
+        frame_rate = self.frame_rate or capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FRAME_RATE
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                frame = cv2.resize(frame, TARGET_SIZE, interpolation=cv2.INTER_AREA)
+                yield frame_rate, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        finally:
+            capture.release()
+
+    def _run(self):
+        frame_index = 0
+        try:
+            while not self._stop.is_set():
+                next_frame_time = time.perf_counter()
+                for frame_rate, frame in self._frames():
+                    if self._stop.is_set():
+                        return
+                    self.buffer.put((frame_index, frame))
+                    frame_index += 1
+
+                    # Play back in real time rather than as fast as we can decode
+                    next_frame_time += 1 / frame_rate
+                    delay = next_frame_time - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                if not self.loop:
+                    break
+        except Exception as e:
+            print(f"Frame source stopped: {e}")
+        finally:
+            self.finished.set()
+
+
+class StreamClassifier:
+    """Classifies the newest buffered frame at classify_rate Hz and reports new emergencies
+
+    predict_fn takes a (N, 224, 224, 3) float32 batch, e.g. InferenceQueue.predict.
+    With a motion_gate.MotionGate, frames the gate considers static are not
+    classified and the previous result stands.
+    A detection is posted to ``detections`` as (frame_index, emergency_probability)
+    when a frame is classified as an emergency and the previous one was not.
+    """
+
+    def __init__(self, frame_source, predict_fn, classify_rate=DEFAULT_CLASSIFY_RATE,
+                 threshold=EMERGENCY_THRESHOLD, gate=None):
+        self.frame_source = frame_source
+        self.predict_fn = predict_fn
+        self.gate = gate
+        self.classify_rate = classify_rate
+        self.threshold = threshold
+        self.detections = queue.Queue()
+        self.classified = 0
+        self._buffer = BatchBuffer(1)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stream-classifier", daemon=True)
+
+    def start(self):
+        self.frame_source.start()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.frame_source.stop()
+
+    def _run(self):
+        in_emergency = False
+        interval = 1 / self.classify_rate
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            item = self.frame_source.buffer.take_latest()
+            if item is None:
+                if self.frame_source.finished.is_set():
+                    break
+            elif self.gate is None or self.gate.should_classify(item[1]):
+                frame_index, frame = item
+                self._buffer.fill(0, frame)
+                try:
+                    probability = float(self.predict_fn(self._buffer.array)[0][1])
+                except Exception as e:
+                    print(f"Error classifying frame {frame_index}: {e}")
+                    probability = 0.0
+                self.classified += 1
+
+                is_emergency = probability > self.threshold
+                if is_emergency and not in_emergency:
+                    self.detections.put((frame_index, probability))
+                in_emergency = is_emergency
+
+            self._stop.wait(max(0.0, interval - (time.perf_counter() - started)))
+
+    def stats(self):
+        buffer = self.frame_source.buffer
+        stats = {
+            'decoded': buffer.written,
+            'overwritten': buffer.overwritten,
+            'classified': self.classified,
+        }
+        if self.gate is not None:
+            stats['gated'] = self.gate.skipped
+        return stats
+
+    def poll(self):
+        """Return the detections posted since the last call (non-blocking)"""
+        detections = []
+        while True:
+            try:
+                detections.append(self.detections.get_nowait())
+            except queue.Empty:
+                return detections
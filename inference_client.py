@@ -0,0 +1,84 @@
+"""Thin client for inference_server.py with an in-process fallback.
+
+The simulators classify through InferenceClient. If the local inference
+server answers its health check, images are sent there and no model is
+loaded in the simulator process at all; otherwise, or as soon as a request
+to the server fails, the client switches to the in-process BackgroundModel
+and InferenceQueue. Switching starts the local model loading in the
+background, so ``status`` reports LOADING until it is ready.
+
+A PredictionCache given to the client only stores and serves local results:
+it is tied to the local model's version, which says nothing about the model
+the server is running.
+"""
+import json
+import os
+import urllib.error
+import urllib.request
+
+from model_loader import READY
+from preprocessing import preprocess_image
+
+DEFAULT_URL = 'http://127.0.0.1:8765'
+HEALTH_TIMEOUT = 0.5
+REQUEST_TIMEOUT = 30
+
+
+class InferenceClient:
+    def __init__(self, local_model, local_queue, url=DEFAULT_URL, client_name=None, cache=None):
+        self.local_model = local_model
+        self.local_queue = local_queue
+        self.cache = cache
+        self.url = url
+        self.client_name = client_name or f"pid-{os.getpid()}"
+        self.remote = False
+
+    def start(self):
+        """Use the server if it is up, otherwise start loading the local model"""
+        try:
+            with urllib.request.urlopen(f"{self.url}/health", timeout=HEALTH_TIMEOUT) as response:
+                self.remote = json.load(response).get('status') == 'ok'
+        except (OSError, ValueError):
+            self.remote = False
+
+        if self.remote:
+            print(f"Using inference server at {self.url}")
+        else:
+            self.local_model.start()
+        return self
+
+    @property
+    def status(self):
+        return READY if self.remote else self.local_model.status
+
+    def predict(self, image_path):
+        """Return the class probabilities for one image file"""
+        if self.remote:
+            try:
+                return self._predict_remote(image_path)
+            except urllib.error.HTTPError:
+                raise
+            except OSError as e:
+                print(f"Inference server unavailable ({e}), loading the local model in the background")
+                self.remote = False
+                self.local_model.start()
+
+        if self.cache is None:
+            return self._predict_local(image_path)
+        cache_key, probabilities = self.cache.lookup(image_path)
+        if probabilities is None:
+            probabilities = self._predict_local(image_path)
+            self.cache.put(cache_key, probabilities)
+        return probabilities
+
+    def _predict_local(self, image_path):
+        # Waits in the queue while the local model is still loading
+        _, img_array = preprocess_image(image_path)
+        return self.local_queue.predict(img_array)[0]
+
+    def _predict_remote(self, image_path):
+        body = json.dumps({'path': os.path.abspath(image_path), 'client': self.client_name}).encode()
+        request = urllib.request.Request(f"{self.url}/predict", data=body,
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            return json.load(response)['probabilities']
@@ -0,0 +1,178 @@
+"""Pre-fork worker pool for offline classification runs.
+
+The parent loads the TFLite model once, with its weights already packed for
+the CPU kernels, and forks the workers afterwards so every process shares
+those pages copy-on-write instead of holding its own copy. Image paths are
+handed out in small chunks from a shared queue, so a worker that finishes
+early simply takes the next chunk, and results are merged back in input
+order. An image that can't be read is reported with its error instead of
+stopping the run, and a worker process that dies is detected rather than
+waited on forever.
+
+Only the TFLite backends are supported: TensorFlow's own runtime does not
+survive a fork once it has run a model, so the Keras backend would hang in
+the workers.
+
+    python inference_pool.py dataset --workers 1 2 4 8 16
+"""
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+
+from model_config import BACKENDS
+from predictor import TFLitePredictor
+from preprocessing import BatchBuffer, list_image_paths, load_image
+
+DEFAULT_CHUNK_SIZE = 16
+# How often result collection checks that the workers are still alive
+LIVENESS_CHECK_SECONDS = 1.0
+
+# Set in the parent just before forking; workers inherit it copy-on-write
+_predictor = None
+
+
+def _worker(task_queue, result_queue, chunk_size):
+    buffer = BatchBuffer(chunk_size)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        index, paths = task
+        # Unreadable images get an error and are left out of the batch
+        probabilities, errors, loaded = [None] * len(paths), [None] * len(paths), []
+        for position, path in enumerate(paths):
+            try:
+                buffer.fill(len(loaded), load_image(path))
+                loaded.append(position)
+            except Exception as e:
+                errors[position] = f"{type(e).__name__}: {e}"
+        if loaded:
+            try:
+                for position, row in zip(loaded, _predictor(buffer.array[:len(loaded)])):
+                    probabilities[position] = row
+            except Exception as e:
+                for position in loaded:
+                    errors[position] = f"{type(e).__name__}: {e}"
+        result_queue.put((index, probabilities, errors))
+
+
+class InferencePool:
+    def __init__(self, backend='tflite-fp32', workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        global _predictor
+        if not backend.startswith('tflite'):
+            raise ValueError("InferencePool needs a TFLite backend; TensorFlow cannot be used across fork")
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+
+        # One interpreter thread per process; parallelism comes from the workers
+        _predictor = TFLitePredictor(BACKENDS[backend], num_threads=1)
+
+        ctx = mp.get_context('fork')
+        self._tasks = ctx.Queue(maxsize=2 * self.workers)
+        self._results = ctx.Queue()
+        self._broken = False
+        self._processes = [ctx.Process(target=_worker, args=(self._tasks, self._results, chunk_size), daemon=True)
+                           for _ in range(self.workers)]
+        for process in self._processes:
+            process.start()
+
+    def _feed(self, chunks):
+        for index, chunk in enumerate(chunks):
+            self._tasks.put((index, chunk))
+
+    def _next_result(self):
+        """Next finished chunk, raising instead of blocking forever if a worker has died"""
+        while True:
+            try:
+                return self._results.get(timeout=LIVENESS_CHECK_SECONDS)
+            except queue.Empty:
+                dead = [process for process in self._processes if not process.is_alive()]
+                if dead:
+                    # Its chunk is lost and the queues can't be trusted any more
+                    self._broken = True
+                    self.terminate()
+                    raise RuntimeError(f"{len(dead)} inference worker(s) died (exit code {dead[0].exitcode})")
+
+    def imap(self, paths):
+        """Yield (path, probabilities, error) for every path, in input order
+
+        error is None on success; for an image that couldn't be read or
+        classified, probabilities is None and error says why.
+        """
+        if self._broken:
+            raise RuntimeError("InferencePool lost a worker and can't be used any more")
+        paths = list(paths)
+        chunks = [paths[i:i + self.chunk_size] for i in range(0, len(paths), self.chunk_size)]
+
+        # Feed from a thread so the bounded task queue never blocks result collection
+        feeder = threading.Thread(target=self._feed, args=(chunks,), daemon=True)
+        feeder.start()
+
+        pending = {}
+        received = 0
+        next_index = 0
+        try:
+            while next_index < len(chunks):
+                index, probabilities, errors = self._next_result()
+                received += 1
+                pending[index] = (probabilities, errors)
+                while next_index in pending:
+                    probabilities, errors = pending.pop(next_index)
+                    yield from zip(chunks[next_index], probabilities, errors)
+                    next_index += 1
+        finally:
+            # If the caller stopped early, collect the chunks still in flight so
+            # they don't turn up in the next imap
+            if not self._broken:
+                for _ in range(len(chunks) - received):
+                    self._next_result()
+                feeder.join()
+
+    def close(self):
+        if self._broken:
+            return
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join()
+
+    def terminate(self):
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def scaling_curve(image_dir, worker_counts, backend='tflite-fp32', limit=None):
+    """Print images/sec for each worker count over the images under image_dir"""
+    paths = list_image_paths(image_dir)[:limit]
+    print(f"{len(paths)} images from {image_dir}, backend {backend}, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8}{'images/sec':>12}{'speedup':>9}")
+    baseline = None
+    for workers in worker_counts:
+        with InferencePool(backend, workers=workers) as pool:
+            start = time.perf_counter()
+            count = sum(1 for _, _, error in pool.imap(paths) if error is None)
+            rate = count / (time.perf_counter() - start)
+        baseline = baseline or rate
+        print(f"{workers:>8}{rate:>12.1f}{rate / baseline:>8.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure pre-fork pool throughput against worker count")
+    parser.add_argument('image_dir', nargs='?', default='dataset')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--backend', default='tflite-fp32', choices=[b for b in BACKENDS if b.startswith('tflite')])
+    parser.add_argument('--limit', type=int)
+    args = parser.parse_args()
+    scaling_curve(args.image_dir, args.workers, args.backend, args.limit)
@@ -0,0 +1,139 @@
+"""Micro-batching queue for the emergency vehicle classifier.
+
+Callers submit single preprocessed images and get a Future back. A worker
+thread collects pending requests for up to ``batch_window_ms`` or
+``max_batch_size`` items, runs them through the model as one batch and hands
+each caller its own row of the output.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+DEFAULT_BATCH_WINDOW_MS = 10
+DEFAULT_MAX_BATCH_SIZE = 16
+
+
+class _Request:
+    def __init__(self, img_array):
+        self.img_array = img_array
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class InferenceQueue:
+    def __init__(self, predict_fn, batch_window_ms=DEFAULT_BATCH_WINDOW_MS,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict_fn = predict_fn
+        self.batch_window_ms = batch_window_ms
+        self.max_batch_size = max_batch_size
+
+        self._requests = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._close_lock = threading.Lock()
+        self._closed = False
+
+        # Counters
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+        self._worker = threading.Thread(target=self._run, name="inference-queue", daemon=True)
+        self._worker.start()
+
+    def submit(self, img_array):
+        """Queue a single image of shape (224, 224, 3) and return a Future of its prediction row"""
+        request = _Request(img_array)
+        # Checked and queued under the lock, so nothing lands behind close()'s sentinel
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("InferenceQueue is closed")
+            self._requests.put(request)
+        return request.future
+
+    def predict(self, img_array):
+        """Drop-in for model.predict: takes a (N, 224, 224, 3) batch and blocks for (N, classes)"""
+        futures = [self.submit(row) for row in img_array]
+        return np.stack([future.result() for future in futures])
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'batches': self.batches,
+                'items': self.items,
+                'avg_batch_size': self.items / self.batches if self.batches else 0.0,
+                'largest_batch': self.largest_batch,
+                'avg_wait_ms': self.total_wait_ms / self.items if self.items else 0.0,
+                'max_wait_ms': self.max_wait_ms,
+            }
+
+    def close(self):
+        """Stop the worker after the requests already queued have been served"""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._requests.put(None)
+        self._worker.join()
+
+        # Fail anything the worker left behind rather than leave its caller waiting
+        while True:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.future.set_exception(RuntimeError("InferenceQueue is closed"))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._requests.get()
+            if first is None:
+                break
+
+            # Gather more requests until the window closes or the batch is full
+            batch = [first]
+            deadline = first.enqueued + self.batch_window_ms / 1000
+            # Requests that queued up behind the previous batch are taken without waiting
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    if timeout > 0:
+                        request = self._requests.get(timeout=timeout)
+                    else:
+                        request = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        dispatched = time.perf_counter()
+        waits_ms = [(dispatched - request.enqueued) * 1000 for request in batch]
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.total_wait_ms += sum(waits_ms)
+            self.max_wait_ms = max(self.max_wait_ms, max(waits_ms))
+
+        try:
+            predictions = self.predict_fn(np.stack([request.img_array for request in batch]))
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        for request, prediction in zip(batch, predictions):
+            request.future.set_result(prediction)
@@ -0,0 +1,131 @@
+"""Local inference daemon shared by the simulator processes.
+
+Loads the classifier once and serves it over HTTP on localhost, so running
+ev6, ev8, ev9 and ev10 side by side costs one model in memory instead of
+four. Requests from all clients go through a single InferenceQueue and are
+therefore batched together.
+
+    python inference_server.py --port 8765 --backend keras
+
+Endpoints:
+    GET  /health   backend name, used by clients to probe for the server
+    GET  /stats    queue counters and per-client latency
+    POST /predict  {"path": ..., "client": ...} -> {"probabilities": [...]}
+"""
+import argparse
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from inference_queue import DEFAULT_BATCH_WINDOW_MS, DEFAULT_MAX_BATCH_SIZE, InferenceQueue
+from model_config import backend_files
+from model_registry import ModelRegistry
+from predictor import load_predictor
+from preprocessing import preprocess_image
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+
+class InferenceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # several simulators may connect at once
+
+    def __init__(self, address, backend='keras', batch_window_ms=DEFAULT_BATCH_WINDOW_MS,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+        self.backend = backend
+        # Replacing the model file swaps the new version in without restarting the server
+        self.model = ModelRegistry(lambda: load_predictor(backend), backend_files(backend))
+        if not self.model.wait():
+            raise RuntimeError(f"Couldn't load the {backend} model: {self.model.error}")
+        self.queue = InferenceQueue(self.model, batch_window_ms=batch_window_ms,
+                                    max_batch_size=max_batch_size)
+        self._client_stats = defaultdict(lambda: {'requests': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        self._stats_lock = threading.Lock()
+        super().__init__(address, _Handler)
+
+    def record(self, client, latency_ms, error=False):
+        with self._stats_lock:
+            stats = self._client_stats[client]
+            stats['requests'] += 1
+            stats['errors'] += int(error)
+            stats['total_ms'] += latency_ms
+            stats['max_ms'] = max(stats['max_ms'], latency_ms)
+
+    def stats(self):
+        with self._stats_lock:
+            clients = {
+                client: {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'avg_ms': stats['total_ms'] / stats['requests'],
+                    'max_ms': stats['max_ms'],
+                }
+                for client, stats in self._client_stats.items()
+            }
+        return {'backend': self.backend, 'model': self.model.stats(), 'queue': self.queue.stats(), 'clients': clients}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok', 'backend': self.server.backend})
+        elif self.path == '/stats':
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {'error': f"unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send_json(404, {'error': f"unknown endpoint {self.path}"})
+            return
+
+        start = time.perf_counter()
+        client = 'unknown'
+        try:
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            client = request.get('client', client)
+            _, img_array = preprocess_image(request['path'])
+            probabilities = self.server.queue.submit(img_array[0]).result()
+        except Exception as e:
+            self.server.record(client, (time.perf_counter() - start) * 1000, error=True)
+            self._send_json(400, {'error': f"{type(e).__name__}: {e}"})
+            return
+
+        self.server.record(client, (time.perf_counter() - start) * 1000)
+        self._send_json(200, {'probabilities': [float(p) for p in probabilities]})
+
+    def log_message(self, format, *args):
+        pass  # one line per request would drown the stats output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the emergency vehicle classifier on localhost")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--backend', default='keras')
+    parser.add_argument('--batch-window-ms', type=float, default=DEFAULT_BATCH_WINDOW_MS)
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    args = parser.parse_args()
+
+    server = InferenceServer((args.host, args.port), args.backend, args.batch_window_ms, args.max_batch_size)
+    print(f"Serving {args.backend} model on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.queue.close()
+        server.model.close()
+        print(json.dumps(server.stats(), indent=2))
@@ -0,0 +1,248 @@
+"""tf.data input pipeline for training the emergency classifier.
+
+ImageDataGenerator.flow_from_directory decodes, resizes and augments every
+JPEG one at a time in Python on every epoch, so training the frozen
+DenseNet121 is input-bound. make_dataset reads the same class-per-folder
+trees or split manifests (splits/train.json, ...). JPEGs are decoded in
+parallel inside the graph and resized to 224x224 with nearest-neighbour
+sampling like the generator. The decoded uint8 images are cached, so only
+the first epoch touches the files. Training batches are then shuffled and
+augmented as whole batches with a single projective-transform op, and the
+next batch is prefetched while the model trains on the current one. Every
+batch gets its own stateless random seed, redrawn each epoch, so the
+augmentation differs between epochs but is reproducible for a given seed.
+
+The augmentation matches the notebook's generator settings. Its
+rotation_range is in degrees, zoom is independent per axis, shifts are
+fractions of the image size, both flips are enabled, and empty borders are
+filled with the nearest pixel. Labels are one-hot in the generator's
+sorted-folder class order.
+
+Run ``python input_pipeline.py [data_dir]`` to compare epoch times against
+the generator, reading the input alone and training a frozen-backbone
+model on it:
+
+    python input_pipeline.py splits --epochs 3 --model my_model.keras
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers import Dense
+from tensorflow.keras.models import load_model
+from tensorflow.keras.optimizers import Adam
+
+from model_config import INPUT_SHAPE, MODEL_PATH
+from split_manifest import SPLITS_DIR, is_manifest, list_images, load_manifest, split_path
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_SEED = 46
+
+# Same settings as the notebook's ImageDataGenerator
+ROTATION_RANGE = 0.2  # degrees
+ZOOM_RANGE = 0.2
+SHIFT_RANGE = 0.2
+
+
+def list_split(directory, classes=None):
+    """Return (image paths, integer labels, class_indices) in flow_from_directory's order
+
+    directory can also be a split manifest (see split_manifest). classes
+    limits a tree to those class folders. For a packed directory (see
+    packed_dataset) the paths are the images' original paths.
+    """
+    from packed_dataset import PackedDataset, is_packed
+
+    if is_packed(directory):
+        packed = PackedDataset(directory)
+        return packed.paths, packed.labels, packed.class_indices
+    return list_images(directory, classes)
+
+
+def decode(path):
+    """uint8 224x224x3 image tensor from a JPEG or PNG file"""
+    img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    return tf.image.resize(img, INPUT_SHAPE[:2], method='nearest')
+
+
+def random_transforms(batch_size, height, width, seed=None):
+    """Projective transform rows for a batch of random rotation/zoom/shift/flip augmentations
+
+    Like the generator, everything is composed into one affine map about the
+    image centre per image, so each image is resampled once. All parameters
+    come from one (batch_size, 7) draw, so they are independent of each
+    other. seed is a stateless [2] seed; without one the global generator
+    is used.
+    """
+    shape = tf.stack([batch_size, 7])
+    if seed is None:
+        draws = tf.random.uniform(shape)
+    else:
+        draws = tf.random.stateless_uniform(shape, seed=seed)
+
+    def uniform(column, low, high):
+        return low + (high - low) * draws[:, column]
+
+    theta = uniform(0, -ROTATION_RANGE, ROTATION_RANGE) * (np.pi / 180)
+    zoom_x, zoom_y = uniform(1, 1 - ZOOM_RANGE, 1 + ZOOM_RANGE), uniform(2, 1 - ZOOM_RANGE, 1 + ZOOM_RANGE)
+    shift_x = uniform(3, -SHIFT_RANGE, SHIFT_RANGE) * width
+    shift_y = uniform(4, -SHIFT_RANGE, SHIFT_RANGE) * height
+    flip_x = tf.where(draws[:, 5] < 0.5, -1.0, 1.0)
+    flip_y = tf.where(draws[:, 6] < 0.5, -1.0, 1.0)
+
+    # Output pixel (x, y) samples input centre + rotation @ zoom @ flip @ ((x, y) - centre) + shift
+    cos, sin = tf.cos(theta), tf.sin(theta)
+    a0, a1 = cos * zoom_x * flip_x, -sin * zoom_y * flip_y
+    b0, b1 = sin * zoom_x * flip_x, cos * zoom_y * flip_y
+    cx, cy = (width - 1) / 2, (height - 1) / 2
+    a2 = cx - a0 * cx - a1 * cy + shift_x
+    b2 = cy - b0 * cx - b1 * cy + shift_y
+    zeros = tf.zeros([batch_size])
+    return tf.stack([a0, a1, a2, b0, b1, b2, zeros, zeros], axis=1)
+
+
+def augment(images, seed=None):
+    """Batched, in-graph equivalent of the generator's rotation/zoom/shift/flip augmentation
+
+    seed is a stateless [2] seed, see random_transforms.
+    """
+    shape = tf.shape(images)
+    height, width = tf.cast(shape[1], tf.float32), tf.cast(shape[2], tf.float32)
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=images, transforms=random_transforms(shape[0], height, width, seed), output_shape=shape[1:3],
+        fill_value=0.0, interpolation='BILINEAR', fill_mode='NEAREST')
+
+
+def make_dataset(directory, batch_size=DEFAULT_BATCH_SIZE, training=False, seed=DEFAULT_SEED, cache='',
+                 shuffle=None):
+    """(images in [0, 1], one-hot labels) batches from a tree, split manifest or packed directory
+
+    training shuffles every epoch and augments; shuffle=True alone gives
+    shuffled, unaugmented batches. cache is a file prefix for the decoded
+    images, or '' to keep them in memory; packed directories are already
+    decoded and are read straight from their memory-mapped shards.
+    """
+    from packed_dataset import PackedDataset, is_packed
+
+    if shuffle is None:
+        shuffle = training
+    if is_packed(directory):
+        packed = PackedDataset(directory)
+        classes = len(packed.class_indices)
+        dataset = packed.dataset(batch_size, shuffle=shuffle, seed=seed)
+        dataset = dataset.map(lambda paths, x, y: (x, tf.one_hot(y, classes)))
+    else:
+        paths, labels, class_indices = list_split(directory)
+        dataset = tf.data.Dataset.from_tensor_slices((paths, tf.one_hot(labels, len(class_indices))))
+        dataset = dataset.map(lambda path, label: (decode(path), label), num_parallel_calls=tf.data.AUTOTUNE)
+        dataset = dataset.cache(cache)
+        if shuffle:
+            dataset = dataset.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size)
+
+    scale = tf.constant(1 / 255, tf.float32)
+    if training:
+        # One stateless seed per batch, drawn afresh every epoch
+        seeds = tf.data.Dataset.random(seed=seed, rerandomize_each_iteration=True).batch(2)
+        dataset = tf.data.Dataset.zip((dataset, seeds))
+        dataset = dataset.map(lambda batch, batch_seed: (augment(tf.cast(batch[0], tf.float32), batch_seed) * scale,
+                                                         batch[1]),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+    else:
+        dataset = dataset.map(lambda x, y: (tf.cast(x, tf.float32) * scale, y),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def generator_split(directory, batch_size=DEFAULT_BATCH_SIZE, training=False, seed=DEFAULT_SEED):
+    """Baseline: the notebook's ImageDataGenerator iterator for a tree or split manifest"""
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    if training:
+        datagen = ImageDataGenerator(rescale=1/255.0, rotation_range=ROTATION_RANGE, zoom_range=ZOOM_RANGE,
+                                     width_shift_range=SHIFT_RANGE, height_shift_range=SHIFT_RANGE,
+                                     vertical_flip=True, horizontal_flip=True)
+    else:
+        datagen = ImageDataGenerator(rescale=1/255.0)
+    if is_manifest(directory):
+        import pandas as pd
+
+        paths, labels, class_indices = load_manifest(directory)
+        class_names = sorted(class_indices, key=class_indices.get)
+        frame = pd.DataFrame({'filename': paths, 'class': [class_names[label] for label in labels]})
+        return datagen.flow_from_dataframe(frame, classes=class_names, batch_size=batch_size,
+                                           target_size=INPUT_SHAPE[:2], class_mode='categorical',
+                                           shuffle=training, seed=seed)
+    return datagen.flow_from_directory(directory, batch_size=batch_size, target_size=INPUT_SHAPE[:2],
+                                       class_mode='categorical', shuffle=training, seed=seed)
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    def on_train_begin(self, logs=None):
+        self.times = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.times.append(time.perf_counter() - self._start)
+
+
+def read_epochs(data, epochs):
+    """Seconds to read every batch of data, per epoch"""
+    times = []
+    for _ in range(epochs):
+        start = time.perf_counter()
+        # The generator loops forever; both it and the dataset know their batch count
+        for _ in zip(range(len(data)), data):
+            pass
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def train_epochs(model_path, train_data, val_data, epochs):
+    """Seconds per epoch fitting model_path's Dense head on a frozen backbone, like the notebook"""
+    model = load_model(model_path)
+    for layer in model.layers:
+        layer.trainable = isinstance(layer, Dense)
+    model.compile(loss='categorical_crossentropy', optimizer=Adam(learning_rate=0.001), metrics=['accuracy'])
+    timer = EpochTimer()
+    model.fit(train_data, epochs=epochs, validation_data=val_data, callbacks=[timer], verbose=0)
+    return timer.times
+
+
+def compare(data_dir, epochs=3, model_path=MODEL_PATH, batch_size=DEFAULT_BATCH_SIZE):
+    """Print per-epoch times of the generator and the tf.data pipeline"""
+    train_dir, val_dir = split_path(data_dir, 'train'), split_path(data_dir, 'val')
+
+    def pipelines():
+        yield 'ImageDataGenerator', generator_split(train_dir, batch_size, training=True), \
+            generator_split(val_dir, batch_size)
+        train_data = make_dataset(train_dir, batch_size, training=True)
+        val_data = make_dataset(val_dir, batch_size)
+        yield 'tf.data', train_data, val_data
+
+    images = len(list_split(train_dir)[0])
+    print(f"{images} training images from {train_dir}, batch size {batch_size}, {os.cpu_count()} CPUs")
+    print("\n| input | stage | epoch 1 s | later epochs s | images/sec |")
+    print("|---|---|---|---|---|")
+    for name, train_data, val_data in pipelines():
+        stages = [('read only', read_epochs(train_data, epochs))]
+        if model_path:
+            stages.append(('fit', train_epochs(model_path, train_data, val_data, epochs)))
+        for stage, times in stages:
+            later = np.mean(times[1:]) if len(times) > 1 else times[0]
+            print(f"| {name} | {stage} | {times[0]:.2f} | {later:.2f} | {images / later:.1f} |")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare tf.data and ImageDataGenerator epoch times")
+    parser.add_argument('data_dir', nargs='?', default=SPLITS_DIR,
+                        help="folder with train/val manifests, or train/ and val/ trees")
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--model', default=MODEL_PATH, help="model to fit for the training comparison, '' to skip")
+    args = parser.parse_args()
+    compare(args.data_dir, args.epochs, args.model, args.batch_size)
@@ -0,0 +1,50 @@
+"""Model file locations shared by the simulators and inference tools.
+
+Kept free of TensorFlow imports so the simulators can read it before the
+model (and TensorFlow itself) is loaded in the background.
+"""
+MODEL_PATH = 'my_model.keras'
+# MobileNetV2 screening model trained by the notebook for the cascade backend
+SCREEN_MODEL_PATH = 'my_model_mobilenet.keras'
+INPUT_SHAPE = (224, 224, 3)
+
+# Runtime backends and the model file each one loads. The fp32 TFLite backend
+# runs the float16-weight export, which keeps float32 inputs and compute.
+# The cascade runs the screening model first and MODEL_PATH only on inputs
+# whose emergency probability falls inside CASCADE_BAND.
+BACKENDS = {
+    'keras': MODEL_PATH,
+    'tflite-fp32': 'my_model_fp16.tflite',
+    'tflite-int8': 'my_model_int8.tflite',
+    'cascade': SCREEN_MODEL_PATH,
+    'student': 'my_model_student.keras',  # written by distill.py
+    'multitask': 'my_model_multitask.keras',  # emergency + vehicle type heads
+}
+CASCADE_BAND = (0.2, 0.8)
+
+
+def backend_files(backend):
+    """Every model file a backend loads; the cascade also loads MODEL_PATH"""
+    if backend == 'cascade':
+        return [BACKENDS[backend], MODEL_PATH]
+    return [BACKENDS[backend]]
+
+# Output order of the classifier (folder 0 and folder 1 of the dataset)
+CLASS_NAMES = ['Normal', 'Emergency Vehicle']
+
+# Output order of the multi-task model's vehicle-type head, matching the
+# simulators' VehicleType values
+VEHICLE_TYPES = ['car', 'truck', 'bike', 'bus', 'ambulance']
+
+
+def split_prediction(prediction):
+    """Split one output row into (emergency probabilities, vehicle type name or None)
+
+    The multi-task model's vehicle-type probabilities follow the emergency
+    ones in the same row; single-task backends have no vehicle type.
+    """
+    emergency = prediction[:len(CLASS_NAMES)]
+    vehicle_type_probs = list(prediction[len(CLASS_NAMES):])
+    if not vehicle_type_probs:
+        return emergency, None
+    return emergency, VEHICLE_TYPES[vehicle_type_probs.index(max(vehicle_type_probs))]
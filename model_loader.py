@@ -0,0 +1,63 @@
+"""Background model loading so the simulators can open their window first.
+
+BackgroundModel runs a loader (TensorFlow import, model load and warm-up) on
+a daemon thread and exposes the result as a predictor. Calls made while it is
+still loading wait for it instead of failing, so requests submitted early are
+simply served once the model is ready.
+"""
+import threading
+import time
+
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class BackgroundModel:
+    def __init__(self, load_fn, startup_time=None):
+        self.load_fn = load_fn
+        self.startup_time = startup_time if startup_time is not None else time.perf_counter()
+        self.predictor = None
+        self.error = None
+        self.ready_seconds = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Begin loading; call this once the window is up"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._load, name="model-loader", daemon=True)
+            self._thread.start()
+        return self
+
+    def _load(self):
+        try:
+            self.predictor = self.load_fn()
+            self.ready_seconds = time.perf_counter() - self.startup_time
+            print(f"ML model ready {self.ready_seconds:.2f}s after startup")
+        except Exception as e:
+            self.error = e
+            print(f"Couldn't load ML model: {e}")
+        finally:
+            self._ready.set()
+
+    @property
+    def status(self):
+        if not self._ready.is_set():
+            return LOADING
+        return READY if self.predictor is not None else FAILED
+
+    def wait(self, timeout=None):
+        """Block until loading finishes; True if the model is usable"""
+        self.start()
+        self._ready.wait(timeout)
+        return self.status == READY
+
+    def __call__(self, img_array):
+        if not self.wait():
+            raise RuntimeError(f"ML model failed to load: {self.error}")
+        return self.predictor(img_array)
+
+    def predict(self, img_array, verbose=0):
+        """model.predict-compatible alias"""
+        return self(img_array)
@@ -0,0 +1,132 @@
+"""Hot-swapping of the classifier when its model file is replaced on disk.
+
+ModelRegistry is a BackgroundModel that keeps watching the model file (or
+files, for a backend such as the cascade that loads several) once the first
+version is loaded. When a file's size or mtime changes and then holds still
+for one poll interval, the files' SHA-256 is compared with the loaded
+version's. A new version is loaded on the watcher thread while the old one
+keeps serving. The new version must pass a warm-up check before
+self.predictor is switched to it: outputs as wide as the first version's,
+finite, with the same row sums (probabilities summing to 1), plus an
+optional check_fn. The first version's outputs are recorded when it loads,
+so the watcher never runs the predictor that is serving requests. The
+switch is a single reference assignment, so an in-flight request finishes
+on the version it started with and no request is dropped. A version that
+fails to load or fails the check is discarded and the current one stays
+(rollback).
+
+self.version names the version behind self.predictor; a PredictionCache
+given the registry keys its entries on it.
+"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from model_config import INPUT_SHAPE
+from model_loader import BackgroundModel
+from prediction_cache import hash_file
+
+DEFAULT_POLL_INTERVAL = 2.0
+
+
+def _probe(predictor):
+    return np.asarray(predictor(np.zeros((2,) + INPUT_SHAPE, dtype=np.float32)))
+
+
+class ModelRegistry(BackgroundModel):
+    def __init__(self, load_fn, model_path, startup_time=None, poll_interval=DEFAULT_POLL_INTERVAL, check_fn=None):
+        super().__init__(self._load_first_version, startup_time)
+        self.model_load_fn = load_fn
+        self.model_paths = [model_path] if isinstance(model_path, str) else list(model_path)
+        self.model_path = ', '.join(self.model_paths)
+        self.poll_interval = poll_interval
+        self.check_fn = check_fn
+        self.version = None
+        self.swaps = 0
+        self.rollbacks = 0
+        self._reference = None
+        self._stat = None
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def _file_stat(self):
+        try:
+            stats = [os.stat(path) for path in self.model_paths]
+        except OSError:
+            return None
+        return tuple((stat.st_size, stat.st_mtime_ns) for stat in stats)
+
+    def _file_version(self):
+        if len(self.model_paths) == 1:
+            return hash_file(self.model_paths[0])
+        return hashlib.sha256(''.join(hash_file(path) for path in self.model_paths).encode()).hexdigest()
+
+    def _load_first_version(self):
+        # Runs before the model is marked ready, so nothing is being served from it yet
+        predictor = self.model_load_fn()
+        self._reference = _probe(predictor)
+        return predictor
+
+    def _load(self):
+        self._stat = self._file_stat()
+        if self._stat is not None:
+            self.version = self._file_version()
+        super()._load()
+        if self.predictor is not None:
+            self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        pending = None
+        while not self._stop.wait(self.poll_interval):
+            stat = self._file_stat()
+            if stat is None or stat == self._stat:
+                pending = None
+                continue
+            if stat != pending:
+                pending = stat  # still being written, or just finished; look again next poll
+                continue
+            self._stat = stat
+            pending = None
+            version = self._file_version()
+            if version != self.version:
+                self._reload(version)
+
+    def check(self, candidate):
+        """Raise if candidate's warm-up output doesn't look like the first version's"""
+        output = _probe(candidate)
+        if output.shape[1:] != self._reference.shape[1:]:
+            raise ValueError(f"output shape {output.shape}, expected {self._reference.shape}")
+        if not np.all(np.isfinite(output)):
+            raise ValueError("non-finite outputs")
+        if not np.allclose(output.sum(axis=1), self._reference.sum(axis=1), atol=1e-3):
+            raise ValueError("outputs are not probabilities")
+        if self.check_fn is not None:
+            self.check_fn(candidate)
+
+    def _reload(self, version):
+        print(f"{self.model_path} changed, loading version {version[:12]} in the background")
+        try:
+            candidate = self.model_load_fn()
+            self.check(candidate)
+        except Exception as e:
+            self.rollbacks += 1
+            print(f"Rejected new {self.model_path} ({e}), still serving version {(self.version or 'none')[:12]}")
+            return
+        # Predictor first: anyone who sees the new version also gets the new predictor
+        self.predictor = candidate
+        self.version = version
+        self.swaps += 1
+        print(f"Now serving {self.model_path} version {version[:12]}")
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'swaps': self.swaps,
+            'rollbacks': self.rollbacks,
+        }
+
+    def close(self):
+        self._stop.set()
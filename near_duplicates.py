@@ -0,0 +1,297 @@
+"""Near-duplicate index over the image corpus using perceptual hashes.
+
+dataset/0 and dataset/1 hold many Augmentor siblings of each source image
+and some near-identical frames under unrelated names. They inflate training
+time, and they leak between splits. This tool hashes every image in
+parallel: a 64-bit pHash (sign of the low 8x8 DCT coefficients against their
+median) or dHash (sign of horizontal gradients). Both ignore resizing,
+re-encoding and small brightness changes. Augmentor also flips images, so
+each image is hashed as stored and mirrored, and a pair matches if any of
+its mirrored hashes is within the Hamming radius.
+
+Pairs are found with a multi-index hash table instead of comparing all
+pairs. The 64 bits are cut into radius + 1 chunks, and one table is kept
+per chunk. Any two hashes within the radius agree exactly on at least one
+chunk (pigeonhole), so only images sharing a bucket are compared.
+
+Matches are merged into clusters with union-find. By default they are also
+merged with the source-id groups from Augmentor's file names, which catch
+siblings cropped too far for any hash. The tool reports the largest
+clusters and cross-split leakage. It can also write a deduplicated manifest
+that keeps one image per cluster, in split_manifest's format, so the
+loaders and split_manifest accept it.
+
+    python near_duplicates.py dataset --classes 0 1 --splits output/train output/val output/test
+    python near_duplicates.py dataset --classes 0 1 --dedup splits/dedup.json
+"""
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from split_manifest import list_images, source_id
+
+HASH_KINDS = ('phash', 'dhash')
+DEFAULT_RADIUS = 8
+HASH_BITS = 64
+
+_PHASH_SIZE = 32
+_k = np.arange(_PHASH_SIZE)
+_DCT = np.cos(np.pi * (2 * _k[np.newaxis, :] + 1) * _k[:, np.newaxis] / (2 * _PHASH_SIZE))
+_BIT_WEIGHTS = np.uint64(1) << np.arange(HASH_BITS, dtype=np.uint64)[::-1]
+
+
+def _pack_bits(bits):
+    return int(np.sum(_BIT_WEIGHTS[bits.flatten()]))
+
+
+def phash(gray):
+    """64-bit pHash of a 32x32 float grayscale array"""
+    coefficients = (_DCT @ gray @ _DCT.T)[:8, :8].flatten()
+    # The DC term only measures brightness, so it is left out of the median
+    return _pack_bits(coefficients > np.median(coefficients[1:]))
+
+
+def dhash(gray):
+    """64-bit dHash of a 9x8 (width x height) float grayscale array"""
+    return _pack_bits(gray[:, 1:] > gray[:, :-1])
+
+
+def image_hashes(path, kind='phash'):
+    """Hashes of the image as stored, flipped left-right, flipped top-bottom, and both"""
+    img = Image.open(path)
+    img.draft('L', (2 * _PHASH_SIZE, 2 * _PHASH_SIZE))
+    size = (_PHASH_SIZE, _PHASH_SIZE) if kind == 'phash' else (9, 8)
+    gray = np.asarray(img.convert('L').resize(size, Image.BILINEAR), dtype=np.float64)
+    hash_fn = phash if kind == 'phash' else dhash
+    if kind == 'dhash':
+        # Resample the mirrored image, since dHash compares neighbours in one direction
+        mirrored = np.asarray(img.convert('L').transpose(Image.FLIP_LEFT_RIGHT).resize(size, Image.BILINEAR),
+                              dtype=np.float64)
+        return [hash_fn(gray), hash_fn(mirrored), hash_fn(gray[::-1]), hash_fn(mirrored[::-1])]
+    return [hash_fn(gray), hash_fn(gray[:, ::-1]), hash_fn(gray[::-1]), hash_fn(gray[::-1, ::-1])]
+
+
+def hash_images(paths, kind='phash', workers=None):
+    """(len(paths), 4) uint64 hashes, one row of mirrored variants per image, hashed on a thread pool"""
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        return np.array(list(executor.map(lambda path: image_hashes(path, kind), paths)), dtype=np.uint64)
+
+
+def popcount(values):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8).reshape(len(values), 8), axis=1).sum(axis=1)
+
+
+class MultiIndexHashTable:
+    """Exact Hamming-radius search over 64-bit hashes, one table per chunk of radius + 1
+
+    Each table is the stored hashes sorted by one chunk, so a batch of
+    queries is matched against it with searchsorted instead of a Python loop.
+    """
+
+    def __init__(self, hashes, radius=DEFAULT_RADIUS):
+        if radius >= HASH_BITS:
+            raise ValueError(f"radius must be below {HASH_BITS}")
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.radius = radius
+        edges = np.linspace(0, HASH_BITS, radius + 2).astype(int)
+        self.chunks = [(np.uint64(start), np.uint64((1 << (end - start)) - 1))
+                       for start, end in zip(edges[:-1], edges[1:])]
+        self.tables = []
+        for shift, mask in self.chunks:
+            keys = (self.hashes >> shift) & mask
+            order = np.argsort(keys, kind='stable')
+            self.tables.append((keys[order], order))
+
+    def query_many(self, values):
+        """(query positions, stored indices, distances) of every pair within radius, each pair once"""
+        values = np.asarray(values, dtype=np.uint64)
+        found = []
+        for (shift, mask), (sorted_keys, order) in zip(self.chunks, self.tables):
+            keys = (values >> shift) & mask
+            left = np.searchsorted(sorted_keys, keys, side='left')
+            counts = np.searchsorted(sorted_keys, keys, side='right') - left
+            queries = np.repeat(np.arange(len(values)), counts)
+            # Position of every candidate within its bucket, offset to the bucket's start
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            ids = order[np.repeat(left, counts) + offsets]
+            # Check distances before deduplicating: far fewer pairs survive than are candidates
+            near = popcount(self.hashes[ids] ^ values[queries]) <= self.radius
+            found.append(queries[near] * len(self.hashes) + ids[near])
+        queries, ids = np.divmod(np.unique(np.concatenate(found)), len(self.hashes))
+        return queries, ids, popcount(self.hashes[ids] ^ values[queries])
+
+    def query(self, value):
+        """(indices, distances) of every stored hash within radius of value"""
+        _, ids, distances = self.query_many([value])
+        return ids, distances
+
+
+def find_pairs(hashes, radius=DEFAULT_RADIUS):
+    """{(i, j): distance} for i < j whose closest mirrored hashes are within radius"""
+    index = MultiIndexHashTable(hashes[:, 0], radius)
+    queries, ids, distances = index.query_many(hashes.reshape(-1))
+    owners = queries // hashes.shape[1]
+    pairs = {}
+    for i, j, distance in zip(owners.tolist(), ids.tolist(), distances.tolist()):
+        if i != j:
+            key = (min(i, j), max(i, j))
+            pairs[key] = min(distance, pairs.get(key, HASH_BITS))
+    return pairs
+
+
+def brute_force_pairs(hashes, radius=DEFAULT_RADIUS):
+    """Same result as find_pairs by comparing every pair, for checking the index"""
+    pairs = {}
+    for i in range(len(hashes)):
+        distances = np.min([popcount(hashes[:, 0] ^ variant) for variant in hashes[i]], axis=0)
+        for j in np.flatnonzero(distances <= radius).tolist():
+            if j != i:
+                key = (min(i, j), max(i, j))
+                pairs[key] = min(int(distances[j]), pairs.get(key, HASH_BITS))
+    return pairs
+
+
+def clusters(count, pairs, groups=None):
+    """Lists of image indices joined by pairs (and by equal groups), largest first, singletons left out"""
+    parent = list(range(count))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    links = list(pairs)
+    if groups is not None:
+        first = {}
+        for i, group in enumerate(groups):
+            links.append((first.setdefault(group, i), i))
+    for i, j in links:
+        parent[find(i)] = find(j)
+
+    members = defaultdict(list)
+    for i in range(count):
+        members[find(i)].append(i)
+    return sorted((ids for ids in members.values() if len(ids) > 1), key=lambda ids: (-len(ids), ids[0]))
+
+
+def leakage(split_paths, paths, pairs, cluster_list):
+    """Print, for each later split, images with a near-duplicate (or cluster mate) in the first split"""
+    position = {path: i for i, path in enumerate(paths)}
+    split_of = {}
+    for name, members in split_paths.items():
+        for path in members:
+            split_of[position[path]] = name
+    neighbours = defaultdict(set)
+    for i, j in pairs:
+        neighbours[i].add(j)
+        neighbours[j].add(i)
+    cluster_of = {i: c for c, ids in enumerate(cluster_list) for i in ids}
+    train = next(iter(split_paths))
+    train_clusters = {cluster_of[i] for i, name in split_of.items() if name == train and i in cluster_of}
+
+    print(f"\n| split | images | near-duplicate in {train} | same cluster as {train} |")
+    print("|---|---|---|---|")
+    for name, members in list(split_paths.items())[1:]:
+        ids = [position[path] for path in members]
+        direct = sum(any(split_of.get(j) == train for j in neighbours[i]) for i in ids)
+        clustered = sum(cluster_of.get(i, -1) in train_clusters for i in ids)
+        print(f"| {name} | {len(ids)} | {direct} ({direct / max(len(ids), 1):.0%}) | "
+              f"{clustered} ({clustered / max(len(ids), 1):.0%}) |")
+    spanning = sum(len({split_of[i] for i in ids if i in split_of}) > 1 for ids in cluster_list)
+    print(f"Clusters spanning more than one split: {spanning}")
+
+
+def write_dedup_manifest(output_path, source, paths, labels, class_indices, cluster_list):
+    """Keep one image per cluster, preferring an original over its augmented copies"""
+    drop = set()
+    for ids in cluster_list:
+        originals = [i for i in ids if source_id(paths[i]) == os.path.basename(paths[i])]
+        keep = min(originals or ids, key=lambda i: paths[i])
+        drop.update(i for i in ids if i != keep)
+    kept = [i for i in range(len(paths)) if i not in drop]
+    class_names = {index: class_name for class_name, index in class_indices.items()}
+    manifest = {
+        'source': source,
+        'split': 'dedup',
+        'classes': class_indices,
+        'paths': [paths[i] for i in kept],
+        'labels': [int(labels[i]) for i in kept],
+        # Same class-qualified group keys as split_manifest writes
+        'groups': [f'{class_names[int(labels[i])]}/{source_id(paths[i])}' for i in kept],
+    }
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return len(kept)
+
+
+def main(image_dir, classes=None, kind='phash', radius=DEFAULT_RADIUS, name_groups=True, splits=None,
+         dedup_path=None, verify=False, top=10):
+    paths, labels, class_indices = list_images(image_dir, classes)
+    split_paths = {}
+    for split in splits or []:
+        split_paths[os.path.splitext(os.path.basename(split.rstrip('/')))[0]] = list_images(split)[0]
+    extra = sorted({path for members in split_paths.values() for path in members} - set(paths))
+    all_paths = paths + extra
+
+    start = time.perf_counter()
+    hashes = hash_images(all_paths, kind)
+    hash_s = time.perf_counter() - start
+    start = time.perf_counter()
+    pairs = find_pairs(hashes, radius)
+    index_s = time.perf_counter() - start
+    groups = [f'{os.path.basename(os.path.dirname(path))}/{source_id(path)}' for path in all_paths]
+    cluster_list = clusters(len(all_paths), pairs, groups if name_groups else None)
+
+    print(f"{len(all_paths)} images, {kind} radius {radius}: hashed in {hash_s:.2f}s "
+          f"({len(all_paths) / hash_s:.0f} images/sec), indexed and queried in {index_s:.2f}s")
+    print(f"{len(pairs)} near-duplicate pairs, "
+          f"{sum(groups[i] != groups[j] for i, j in pairs)} of them across Augmentor source groups")
+    clustered = sum(map(len, cluster_list))
+    print(f"{len(cluster_list)} clusters{' (hash matches + source groups)' if name_groups else ''} holding "
+          f"{clustered} images; {len(all_paths) - clustered + len(cluster_list)} unique images")
+    if verify:
+        start = time.perf_counter()
+        expected = brute_force_pairs(hashes, radius)
+        print(f"Brute force over all {len(all_paths) * (len(all_paths) - 1) // 2:,} pairs: "
+              f"{time.perf_counter() - start:.2f}s, {'same pairs' if expected == pairs else 'DIFFERENT pairs'}")
+
+    print(f"\nLargest {top} clusters:")
+    for ids in cluster_list[:top]:
+        names = ', '.join(all_paths[i] for i in ids[:3])
+        print(f"  {len(ids):>3}  {names}{', ...' if len(ids) > 3 else ''}")
+
+    if split_paths:
+        leakage(split_paths, all_paths, pairs, cluster_list)
+    if dedup_path:
+        # Only the corpus images are written; split images outside it just took part in the clustering
+        corpus_clusters = [[i for i in ids if i < len(paths)] for ids in cluster_list]
+        kept = write_dedup_manifest(dedup_path, image_dir, paths, labels, class_indices,
+                                    [ids for ids in corpus_clusters if len(ids) > 1])
+        print(f"\nWrote {dedup_path}: {kept} of {len(paths)} images")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find near-duplicate images with perceptual hashes")
+    parser.add_argument('image_dir', nargs='?', default='dataset', help="class-per-folder tree or manifest")
+    parser.add_argument('--classes', nargs='+', help="class folders to include (default: every subfolder)")
+    parser.add_argument('--hash', choices=HASH_KINDS, default='phash')
+    parser.add_argument('--radius', type=int, default=DEFAULT_RADIUS, help="max Hamming distance of a match")
+    parser.add_argument('--name-groups', action=argparse.BooleanOptionalAction, default=True,
+                        help="also cluster Augmentor siblings by their source id")
+    parser.add_argument('--splits', nargs='+', help="manifests or split folders to check for leakage, train first")
+    parser.add_argument('--dedup', help="write a manifest keeping one image per cluster")
+    parser.add_argument('--verify', action='store_true', help="check the index against brute force")
+    parser.add_argument('--top', type=int, default=10, help="clusters to list")
+    args = parser.parse_args()
+    main(args.image_dir, args.classes, args.hash, args.radius, args.name_groups, args.splits, args.dedup,
+         args.verify, args.top)
@@ -0,0 +1,222 @@
+"""Packed, memory-mapped copies of the class-per-folder image trees.
+
+Every pass over dataset/ or a split opens thousands of small JPEGs and
+decodes each one again. pack() decodes a tree or split manifest once, at the training
+resolution (224x224, nearest-neighbour, like input_pipeline.decode). It
+writes the images as uint8 shards and adds an index.json sidecar:
+
+    packed/train/images-00000.npy   (up to shard_size, 224, 224, 3) uint8
+    packed/train/images-00001.npy   ...
+    packed/train/index.json         classes, shard sizes, and each image's
+                                    source path and label
+
+PackedDataset memory-maps the shards, so a full read is a sequential scan
+of a few large files with no decoding. input_pipeline.make_dataset and
+list_split, and classify_dir, accept a packed directory wherever they
+accept an image tree. That means the notebook only needs its
+train_dir/val_dir/test_dir pointed at the packed copies.
+
+    python packed_dataset.py pack splits/train.json packed/train
+    python packed_dataset.py pack dataset packed/dataset --classes 0 1
+    python packed_dataset.py benchmark dataset packed/dataset
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import input_pipeline
+from model_config import INPUT_SHAPE
+
+INDEX_FILE = 'index.json'
+DEFAULT_SHARD_SIZE = 1024
+DEFAULT_BATCH_SIZE = 64
+
+
+def is_packed(directory):
+    return os.path.isfile(os.path.join(directory, INDEX_FILE))
+
+
+def pack(directory, out_dir, shard_size=DEFAULT_SHARD_SIZE, classes=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Decode a class-per-folder tree or manifest into uint8 .npy shards plus index.json; returns the count"""
+    paths, labels, class_indices = input_pipeline.list_split(directory, classes)
+    os.makedirs(out_dir, exist_ok=True)
+    decoded = (tf.data.Dataset.from_tensor_slices(paths)
+               .map(input_pipeline.decode, num_parallel_calls=tf.data.AUTOTUNE)
+               .batch(batch_size)
+               .prefetch(tf.data.AUTOTUNE)
+               .as_numpy_iterator())
+
+    shards, memmaps = [], []
+    for start in range(0, len(paths), shard_size):
+        count = min(shard_size, len(paths) - start)
+        filename = f'images-{len(shards):05d}.npy'
+        memmaps.append(np.lib.format.open_memmap(os.path.join(out_dir, filename), mode='w+', dtype=np.uint8,
+                                                 shape=(count,) + INPUT_SHAPE))
+        shards.append({'file': filename, 'count': count})
+
+    row = 0
+    for batch in decoded:
+        # A decoded batch can straddle two shards
+        while len(batch):
+            shard_id, offset = divmod(row, shard_size)
+            taken = min(len(batch), shard_size - offset)
+            memmaps[shard_id][offset:offset + taken] = batch[:taken]
+            batch = batch[taken:]
+            row += taken
+    for memmap in memmaps:
+        memmap.flush()
+    del memmaps
+
+    index = {
+        'source': os.path.abspath(directory),
+        'classes': class_indices,
+        'image_shape': list(INPUT_SHAPE),
+        'shards': shards,
+        'paths': paths,
+        'labels': labels.tolist(),
+    }
+    with open(os.path.join(out_dir, INDEX_FILE), 'w') as f:
+        json.dump(index, f)
+    return len(paths)
+
+
+class PackedDataset:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.class_indices = index['classes']
+        self.paths = index['paths']
+        self.labels = np.array(index['labels'])
+        self.shards = [np.load(os.path.join(directory, shard['file']), mmap_mode='r') for shard in index['shards']]
+        # Global row -> (shard, row in shard)
+        self._offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __len__(self):
+        return len(self.paths)
+
+    def read(self, rows):
+        """uint8 (len(rows), 224, 224, 3) images for global row numbers, read shard by shard"""
+        rows = np.asarray(rows)
+        out = np.empty((len(rows),) + INPUT_SHAPE, dtype=np.uint8)
+        shard_ids = np.searchsorted(self._offsets, rows, side='right') - 1
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            local = rows[mask] - self._offsets[shard_id]
+            if np.all(np.diff(local) == 1):
+                out[mask] = self.shards[shard_id][local[0]:local[-1] + 1]
+            else:
+                order = np.argsort(local)  # ascending offsets keep the reads sequential
+                out[np.flatnonzero(mask)[order]] = self.shards[shard_id][local[order]]
+        return out
+
+    def batches(self, batch_size=DEFAULT_BATCH_SIZE, shuffle=False, seed=None):
+        """Yield (paths, uint8 images, integer labels), in a fresh random order per call if shuffle"""
+        order = np.random.default_rng(seed).permutation(len(self)) if shuffle else np.arange(len(self))
+        paths = np.array(self.paths)
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            yield paths[rows], self.read(rows), self.labels[rows]
+
+    def dataset(self, batch_size=DEFAULT_BATCH_SIZE, shuffle=False, seed=None):
+        """tf.data batches of (paths, uint8 images, integer labels), reshuffled every epoch if shuffle"""
+        epoch = itertools.count()
+
+        def generate():
+            epoch_seed = None if seed is None else seed + next(epoch)
+            yield from self.batches(batch_size, shuffle, epoch_seed)
+
+        dataset = tf.data.Dataset.from_generator(generate, output_signature=(
+            tf.TensorSpec(shape=(None,), dtype=tf.string),
+            tf.TensorSpec(shape=(None,) + INPUT_SHAPE, dtype=tf.uint8),
+            tf.TensorSpec(shape=(None,), dtype=tf.int64),
+        ))
+        # Lets len() and model.fit know the epoch length up front
+        return dataset.apply(tf.data.experimental.assert_cardinality(-(-len(self) // batch_size)))
+
+
+def _evict(paths):
+    """Drop paths from the OS page cache so the next read comes from disk"""
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)  # dirty pages, e.g. of freshly packed shards, can't be dropped
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def benchmark(image_dir, packed_dir, batch_size=DEFAULT_BATCH_SIZE, repeats=3):
+    """Full-dataset read time of the JPEG tree and its packed copy, with a cold and a warm page cache"""
+    packed = PackedDataset(packed_dir)
+    jpeg_paths = packed.paths
+    shard_paths = [os.path.join(packed_dir, f'images-{index:05d}.npy') for index in range(len(packed.shards))]
+
+    def read_jpegs():
+        dataset = (tf.data.Dataset.from_tensor_slices(jpeg_paths)
+                   .map(input_pipeline.decode, num_parallel_calls=tf.data.AUTOTUNE)
+                   .batch(batch_size)
+                   .prefetch(tf.data.AUTOTUNE))
+        for _ in dataset:
+            pass
+
+    def read_packed():
+        for _ in PackedDataset(packed_dir).batches(batch_size):
+            pass
+
+    def read_packed_tf():
+        for _ in PackedDataset(packed_dir).dataset(batch_size).prefetch(tf.data.AUTOTUNE):
+            pass
+
+    methods = [
+        ('JPEG tree, tf.data decode', read_jpegs, jpeg_paths),
+        ('packed, numpy batches', read_packed, shard_paths),
+        ('packed, tf.data', read_packed_tf, shard_paths),
+    ]
+    print(f"{len(packed)} images: {image_dir} "
+          f"({sum(os.path.getsize(p) for p in jpeg_paths) / 2 ** 20:.0f} MB of JPEGs) vs {packed_dir} "
+          f"({sum(os.path.getsize(p) for p in shard_paths) / 2 ** 20:.0f} MB of shards)")
+    print("\n| reader | cold s | warm s | warm images/sec |")
+    print("|---|---|---|---|")
+    for name, read, files in methods:
+        cold = []
+        for _ in range(repeats):
+            _evict(files)
+            start = time.perf_counter()
+            read()
+            cold.append(time.perf_counter() - start)
+        warm = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            read()
+            warm.append(time.perf_counter() - start)
+        print(f"| {name} | {np.median(cold):.2f} | {np.median(warm):.2f} | {len(packed) / np.median(warm):.0f} |")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack class-folder image trees into memory-mapped shards")
+    commands = parser.add_subparsers(dest='command', required=True)
+    pack_parser = commands.add_parser('pack', help="pack one class-per-folder tree or split manifest")
+    pack_parser.add_argument('image_dir')
+    pack_parser.add_argument('packed_dir')
+    pack_parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE, help="images per shard")
+    pack_parser.add_argument('--classes', nargs='+', help="class folders to pack (default: every subfolder)")
+    bench_parser = commands.add_parser('benchmark', help="compare full read times against the JPEG tree")
+    bench_parser.add_argument('image_dir')
+    bench_parser.add_argument('packed_dir')
+    bench_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    bench_parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        start = time.perf_counter()
+        count = pack(args.image_dir, args.packed_dir, args.shard_size, args.classes)
+        print(f"Packed {count} images from {args.image_dir} into {args.packed_dir} "
+              f"in {time.perf_counter() - start:.1f}s")
+    else:
+        benchmark(args.image_dir, args.packed_dir, args.batch_size, args.repeats)
@@ -0,0 +1,146 @@
+"""Prediction cache keyed by a hash of the image file bytes.
+
+Re-uploading the same snapshot returns its stored class probabilities instead
+of decoding the image and running the model again. Entries live in a bounded
+in-memory LRU and, optionally, in an SQLite file that survives restarts.
+Both tiers are tied to a model version: the one a ModelRegistry is serving
+when the cache is given the registry, otherwise the model files' size and
+mtime. A new version invalidates everything cached against the old one.
+lookup() hands out a key that records the version it was made under, so a
+prediction that was computed while the model was being swapped is never
+stored under the new version.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+DEFAULT_CAPACITY = 256
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class PredictionCache:
+    def __init__(self, model_path, capacity=DEFAULT_CAPACITY, disk_path=None, registry=None):
+        self.model_path = model_path
+        self.registry = registry
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Checked on first use, when a registry has loaded its model
+        self._model_version = None
+        self._checked = False
+
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS predictions "
+                             "(key TEXT PRIMARY KEY, model_version TEXT, probabilities TEXT)")
+            self._db.commit()
+
+        # Counters
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _current_model_version(self):
+        if self.registry is not None and self.registry.version is not None:
+            return self.registry.version
+        paths = [self.model_path] if isinstance(self.model_path, str) else self.model_path
+        try:
+            stats = [os.stat(path) for path in paths]
+        except OSError:
+            return None
+        return ';'.join(f"{stat.st_size}-{stat.st_mtime_ns}" for stat in stats)
+
+    def _check_model_version(self):
+        """Drop every entry made with another model version and return the current one"""
+        version = self._current_model_version()
+        if self._checked and version == self._model_version:
+            return version
+        if self._checked:
+            self.invalidations += 1
+        self._checked = True
+        self._model_version = version
+        self._entries.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM predictions WHERE model_version IS NOT ?", (version,))
+            self._db.commit()
+        return version
+
+    def lookup(self, image_path):
+        """Return (key, probabilities), with probabilities None on a miss"""
+        key = (hash_file(image_path), self._current_model_version())
+        return key, self.get(key)
+
+    def get(self, key):
+        """Probabilities for an (image hash, model version) key, or None"""
+        image_hash, version = key
+        with self._lock:
+            if self._check_model_version() != version:
+                self.misses += 1
+                return None
+            if image_hash in self._entries:
+                self._entries.move_to_end(image_hash)
+                self.hits += 1
+                return self._entries[image_hash]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT probabilities FROM predictions WHERE key = ? AND model_version IS ?",
+                                       (image_hash, version)).fetchone()
+                if row is not None:
+                    probabilities = tuple(json.loads(row[0]))
+                    self._store(image_hash, probabilities)
+                    self.disk_hits += 1
+                    return probabilities
+
+            self.misses += 1
+            return None
+
+    def put(self, key, probabilities):
+        image_hash, version = key
+        probabilities = tuple(float(p) for p in probabilities)
+        with self._lock:
+            # Computed by a model that has been replaced since the lookup
+            if self._check_model_version() != version:
+                return
+            self._store(image_hash, probabilities)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)",
+                                 (image_hash, version, json.dumps(probabilities)))
+                self._db.commit()
+
+    def _store(self, key, probabilities):
+        self._entries[key] = probabilities
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+            }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,202 @@
+"""Compiled fast path for running my_model.keras on preprocessed images.
+
+model.predict() builds a data adapter and iterator on every call, which costs
+milliseconds before any math runs. Predictor traces the model once into a
+tf.function with a fixed (None, 224, 224, 3) float32 signature and warms it
+up at load time, so each call goes straight to the compiled graph. Models
+with several heads return them side by side in one row per image (see
+model_config.split_prediction).
+
+TFLitePredictor runs the models written by export_tflite.py behind the same
+call interface, CascadePredictor chains a small screening model in front of
+the full one, and load_predictor() picks one of them by backend name.
+
+Run ``python predictor.py`` to compare its latency against model.predict.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import thread_config
+thread_config.apply()  # before TensorFlow loads; keeps a profile the entry point applied first
+
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+
+from model_config import BACKENDS, CASCADE_BAND, INPUT_SHAPE, MODEL_PATH
+
+
+def _concat_heads(outputs):
+    """Multi-head models return one tensor per head; join them into one row per input"""
+    if isinstance(outputs, (list, tuple)):
+        return tf.concat(outputs, axis=-1)
+    return outputs
+
+
+class Predictor:
+    def __init__(self, model, jit_compile=False, warmup=True):
+        self.model = model
+        self.jit_compile = jit_compile
+        self._predict = tf.function(
+            lambda img_array: _concat_heads(model(img_array, training=False)),
+            input_signature=[tf.TensorSpec(shape=(None,) + INPUT_SHAPE, dtype=tf.float32)],
+            jit_compile=jit_compile,
+        )
+        if warmup:
+            self.warmup()
+
+    @classmethod
+    def from_path(cls, model_path=MODEL_PATH, jit_compile=False, warmup=True):
+        return cls(load_model(model_path), jit_compile=jit_compile, warmup=warmup)
+
+    def warmup(self, batch_sizes=(1,)):
+        """Trace (and with XLA, compile) the graph before the first real request"""
+        for batch_size in batch_sizes:
+            self(np.zeros((batch_size,) + INPUT_SHAPE, dtype=np.float32))
+
+    def __call__(self, img_array):
+        """Run a (N, 224, 224, 3) batch and return the (N, classes) probabilities"""
+        return self._predict(tf.convert_to_tensor(img_array, dtype=tf.float32)).numpy()
+
+    def predict(self, img_array, verbose=0):
+        """model.predict-compatible alias"""
+        return self(img_array)
+
+
+class TFLitePredictor:
+    def __init__(self, model_path, num_threads=None, warmup=True):
+        self.model_path = model_path
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        if len(self.interpreter.get_output_details()) > 1:
+            raise ValueError(f"{model_path} has several outputs; multi-head models need the Keras backend")
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = self._input['shape'][0]
+        if warmup:
+            self(np.zeros((1,) + INPUT_SHAPE, dtype=np.float32))
+
+    def _resize(self, batch_size):
+        self.interpreter.resize_tensor_input(self._input['index'], (batch_size,) + INPUT_SHAPE)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = batch_size
+
+    def __call__(self, img_array):
+        """Run a (N, 224, 224, 3) float batch and return the (N, classes) probabilities"""
+        img_array = np.asarray(img_array, dtype=np.float32)
+        if img_array.shape[0] != self._batch_size:
+            self._resize(img_array.shape[0])
+
+        # Fully quantized models take and return integers
+        if self._input['dtype'] != np.float32:
+            scale, zero_point = self._input['quantization']
+            info = np.iinfo(self._input['dtype'])
+            img_array = np.clip(np.round(img_array / scale + zero_point), info.min, info.max)
+            img_array = img_array.astype(self._input['dtype'])
+
+        self.interpreter.set_tensor(self._input['index'], img_array)
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self._output['index'])
+
+        if self._output['dtype'] != np.float32:
+            scale, zero_point = self._output['quantization']
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+    def predict(self, img_array, verbose=0):
+        """model.predict-compatible alias"""
+        return self(img_array)
+
+
+class CascadePredictor:
+    """Answers with a cheap screening model and escalates uncertain inputs to the full model
+
+    Rows whose screen emergency probability lies inside band (inclusive) are
+    re-run through expert and take its probabilities; the rest keep the
+    screen's answer.
+    """
+
+    def __init__(self, screen, expert, band=CASCADE_BAND):
+        self.screen = screen
+        self.expert = expert
+        self.band = band
+        self.inputs = 0
+        self.escalated = 0
+
+    def __call__(self, img_array):
+        """Run a (N, 224, 224, 3) batch and return the (N, classes) probabilities"""
+        img_array = np.asarray(img_array, dtype=np.float32)
+        probabilities = np.array(self.screen(img_array))
+        low, high = self.band
+        uncertain = np.flatnonzero((probabilities[:, 1] >= low) & (probabilities[:, 1] <= high))
+        if len(uncertain):
+            probabilities[uncertain] = self.expert(img_array[uncertain])
+        self.inputs += len(probabilities)
+        self.escalated += len(uncertain)
+        return probabilities
+
+    def predict(self, img_array, verbose=0):
+        """model.predict-compatible alias"""
+        return self(img_array)
+
+    @property
+    def escalation_rate(self):
+        return self.escalated / self.inputs if self.inputs else 0.0
+
+
+def load_predictor(backend='keras', model_path=None, jit_compile=False):
+    """Load the classifier for one of BACKENDS, optionally from a non-default file"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {sorted(BACKENDS)}")
+    model_path = model_path or BACKENDS[backend]
+    if backend == 'cascade':
+        return CascadePredictor(Predictor.from_path(model_path, jit_compile=jit_compile),
+                                Predictor.from_path(MODEL_PATH, jit_compile=jit_compile))
+    if backend.startswith('tflite'):
+        return TFLitePredictor(model_path)
+    return Predictor.from_path(model_path, jit_compile=jit_compile)
+
+
+def _time_calls(fn, img_array, runs):
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(img_array)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def compare_latency(model_path=MODEL_PATH, runs=50, batch_size=1, jit_compile=False):
+    """Time plain model.predict against the compiled Predictor on random inputs"""
+    model = load_model(model_path)
+    img_array = np.random.rand(batch_size, *INPUT_SHAPE).astype(np.float32)
+
+    # Warm both paths so tracing is not counted as steady-state latency
+    model.predict(img_array, verbose=0)
+    predictor = Predictor(model, jit_compile=jit_compile, warmup=False)
+    predictor.warmup(batch_sizes=(batch_size,))
+
+    results = {
+        'model.predict': _time_calls(lambda x: model.predict(x, verbose=0), img_array, runs),
+        'Predictor (XLA)' if jit_compile else 'Predictor': _time_calls(predictor, img_array, runs),
+    }
+
+    print(f"Batch size {batch_size}, {runs} runs")
+    print(f"{'path':<20}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, latencies in results.items():
+        print(f"{name:<20}{latencies.mean():>10.2f}{np.percentile(latencies, 50):>10.2f}"
+              f"{np.percentile(latencies, 95):>10.2f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare model.predict with the compiled Predictor")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--jit', action='store_true', help="compile the predictor with XLA")
+    args = parser.parse_args()
+    compare_latency(args.model, runs=args.runs, batch_size=args.batch_size, jit_compile=args.jit)
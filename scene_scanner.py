@@ -0,0 +1,209 @@
+"""Emergency-vehicle heatmaps over whole scene images in one backbone pass.
+
+predict_vehicle_type squashes a whole photo to 224x224, so a small ambulance
+in a wide intersection shot is lost, and classifying many crops multiplies
+the cost. SceneScanner rebuilds the trained classifier fully
+convolutionally. The backbone runs once over the full-resolution scene. A
+7x7 average pool with stride 1 over its feature map reproduces the
+training-time global average pool of every 224x224 window. The Dense head
+becomes a 1x1 convolution, so the output is an emergency probability for
+every window position on a 32-pixel grid, which is the same grid a sliding
+window with stride 32 would cover.
+
+detect() turns the heatmap into bounding regions by thresholding and
+greedy non-maximum suppression.
+
+Run ``python scene_scanner.py [image_dir]`` to benchmark it against cropping
+and classifying sliding windows on synthetic wide scenes built from the
+dataset.
+"""
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+from tensorflow.keras import Model
+from tensorflow.keras.layers import AveragePooling2D, Conv2D, Dense, GlobalAveragePooling2D, Softmax
+from tensorflow.keras.models import load_model
+
+from model_config import CLASS_NAMES, INPUT_SHAPE, MODEL_PATH
+from predictor import Predictor
+from preprocessing import list_image_paths, load_image
+
+DEFAULT_MAX_SIDE = 1280
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_OVERLAP = 0.3
+EMERGENCY_INDEX = CLASS_NAMES.index('Emergency Vehicle')
+
+
+def _free_spatial_dims(config):
+    """Let every InputLayer in a (nested) model config accept any height and width"""
+    if isinstance(config, dict):
+        if config.get('class_name') == 'InputLayer':
+            shape = config['config']['batch_shape']
+            config['config']['batch_shape'] = [shape[0], None, None, shape[-1]]
+        for value in config.values():
+            _free_spatial_dims(value)
+    elif isinstance(config, list):
+        for value in config:
+            _free_spatial_dims(value)
+
+
+def load_scene(image_path, max_side=DEFAULT_MAX_SIDE):
+    """Return (float32 H x W x 3 array in [0, 1], original / scanned scale)
+
+    Scenes are shrunk to at most max_side pixels on the long side, to bound
+    the cost, and enlarged if needed so they hold at least one window.
+    """
+    img = Image.open(image_path).convert('RGB')
+    scale = min(1.0, max_side / max(img.size))
+    scale = max(scale, INPUT_SHAPE[1] / img.size[0], INPUT_SHAPE[0] / img.size[1])
+    if scale != 1.0:
+        img = img.resize((round(img.size[0] * scale), round(img.size[1] * scale)), Image.BILINEAR)
+    return np.asarray(img, dtype=np.float32) / 255.0, 1 / scale
+
+
+class SceneScanner:
+    def __init__(self, model, max_side=DEFAULT_MAX_SIDE):
+        self.max_side = max_side
+
+        config = model.get_config()
+        _free_spatial_dims(config)
+        flexible = Model.from_config(config)
+        flexible.set_weights(model.get_weights())
+
+        pool = next(layer for layer in flexible.layers if isinstance(layer, GlobalAveragePooling2D))
+        head = next(layer for layer in flexible.layers if isinstance(layer, Dense))
+        # Feature-map cells covered by one 224x224 input, and pixels per cell
+        self.window_cells = model.get_layer(pool.name).input.shape[1]
+        self.stride = INPUT_SHAPE[0] // self.window_cells
+
+        pooled = AveragePooling2D(self.window_cells, strides=1)(pool.input)
+        head_conv = Conv2D(head.units, 1)
+        logits = head_conv(pooled)
+        kernel, bias = head.get_weights()
+        head_conv.set_weights([kernel.reshape(1, 1, *kernel.shape), bias])
+        self.model = Model(flexible.input, Softmax()(logits))
+
+        self._scan = tf.function(
+            lambda img_array: self.model(img_array, training=False),
+            input_signature=[tf.TensorSpec(shape=(1, None, None, 3), dtype=tf.float32)],
+        )
+
+    @classmethod
+    def from_path(cls, model_path=MODEL_PATH, max_side=DEFAULT_MAX_SIDE):
+        return cls(load_model(model_path), max_side=max_side)
+
+    def scan(self, img_array):
+        """Emergency probability of the window at (row * stride, col * stride) for an H x W x 3 scene"""
+        return self._scan(tf.convert_to_tensor(img_array[np.newaxis]))[0, :, :, EMERGENCY_INDEX].numpy()
+
+    def regions(self, heatmap, threshold=DEFAULT_THRESHOLD, overlap=DEFAULT_OVERLAP, scale=1.0):
+        """(x0, y0, x1, y1, probability) windows above threshold, suppressing overlapping weaker ones"""
+        size = INPUT_SHAPE[0]
+        kept = []
+        rows, cols = np.nonzero(heatmap > threshold)
+        for index in np.argsort(-heatmap[rows, cols]):
+            y0, x0 = rows[index] * self.stride, cols[index] * self.stride
+            box = (x0, y0, x0 + size, y0 + size)
+            if all(_iou(box, other[:4]) <= overlap for other in kept):
+                kept.append(box + (float(heatmap[rows[index], cols[index]]),))
+        return [(round(x0 * scale), round(y0 * scale), round(x1 * scale), round(y1 * scale), p)
+                for x0, y0, x1, y1, p in kept]
+
+    def detect(self, image_path, threshold=DEFAULT_THRESHOLD, overlap=DEFAULT_OVERLAP):
+        """Bounding regions, in original image pixels, likely to contain an emergency vehicle"""
+        img_array, scale = load_scene(image_path, self.max_side)
+        return self.regions(self.scan(img_array), threshold, overlap, scale)
+
+
+def _iou(a, b):
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    return intersection / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection)
+
+
+def sliding_window_heatmap(predictor, img_array, stride, batch_size=32):
+    """Baseline: crop every 224x224 window at stride and classify the crops in batches"""
+    size = INPUT_SHAPE[0]
+    rows = (img_array.shape[0] - size) // stride + 1
+    cols = (img_array.shape[1] - size) // stride + 1
+    origins = [(row * stride, col * stride) for row in range(rows) for col in range(cols)]
+    probabilities = []
+    for start in range(0, len(origins), batch_size):
+        crops = np.stack([img_array[y:y + size, x:x + size] for y, x in origins[start:start + batch_size]])
+        probabilities.append(predictor(crops)[:, EMERGENCY_INDEX])
+    return np.concatenate(probabilities).reshape(rows, cols)
+
+
+def synthetic_scene(background_path, vehicle_path, size, rng):
+    """A wide scene: a normal image stretched to size with one emergency image pasted at 224x224"""
+    scene = Image.open(background_path).convert('RGB').resize(size, Image.BILINEAR)
+    vehicle = load_image(vehicle_path)
+    x = int(rng.integers(0, size[0] - vehicle.size[0] + 1))
+    y = int(rng.integers(0, size[1] - vehicle.size[1] + 1))
+    scene.paste(vehicle, (x, y))
+    return np.asarray(scene, dtype=np.float32) / 255.0, (x, y, x + vehicle.size[0], y + vehicle.size[1])
+
+
+def benchmark(image_dir, scenes=5, size=(1280, 720), model_path=MODEL_PATH, naive_stride=112, seed=0):
+    """Compare scanner and sliding-window time, agreement and localisation on synthetic scenes"""
+    rng = np.random.default_rng(seed)
+    normal = list_image_paths(f"{image_dir}/0")
+    emergency = list_image_paths(f"{image_dir}/1")
+
+    model = load_model(model_path)
+    scanner = SceneScanner(model)
+    predictor = Predictor(model)
+    strides = sorted({scanner.stride, naive_stride})
+    timings = {'scanner': [], **{f"windows/{s}": [] for s in strides}}
+    hits = {name: 0 for name in timings}
+    max_diff = 0.0
+
+    for index in range(scenes):
+        img_array, truth = synthetic_scene(normal[rng.integers(len(normal))],
+                                           emergency[rng.integers(len(emergency))], size, rng)
+        if index == 0:
+            scanner.scan(img_array)  # trace once outside the timings
+
+        heatmaps = {}
+        start = time.perf_counter()
+        heatmaps['scanner'] = scanner.scan(img_array)
+        timings['scanner'].append(time.perf_counter() - start)
+        for stride in strides:
+            start = time.perf_counter()
+            heatmaps[f"windows/{stride}"] = sliding_window_heatmap(predictor, img_array, stride)
+            timings[f"windows/{stride}"].append(time.perf_counter() - start)
+
+        # Same grid, so any difference is down to padding effects at window borders
+        max_diff = max(max_diff, float(np.abs(heatmaps['scanner'] - heatmaps[f"windows/{scanner.stride}"]).max()))
+        for name, heatmap in heatmaps.items():
+            stride = scanner.stride if name == 'scanner' else int(name.split('/')[1])
+            row, col = np.unravel_index(np.argmax(heatmap), heatmap.shape)
+            box = (col * stride, row * stride, col * stride + INPUT_SHAPE[1], row * stride + INPUT_SHAPE[0])
+            hits[name] += _iou(box, truth) >= 0.5
+
+    print(f"{scenes} synthetic {size[0]}x{size[1]} scenes from {image_dir}, grid stride {scanner.stride}")
+    print(f"{'method':<16}{'windows':>9}{'mean ms':>10}{'speedup':>9}{'top hit':>9}")
+    baseline = np.mean(timings[f"windows/{scanner.stride}"])
+    for name, times in timings.items():
+        stride = scanner.stride if name == 'scanner' else int(name.split('/')[1])
+        windows = ((size[1] - INPUT_SHAPE[0]) // stride + 1) * ((size[0] - INPUT_SHAPE[1]) // stride + 1)
+        print(f"{name:<16}{windows:>9}{np.mean(times) * 1000:>10.1f}{baseline / np.mean(times):>8.1f}x"
+              f"{hits[name] / scenes:>9.0%}")
+    print(f"Max |scanner - windows/{scanner.stride}| probability difference: {max_diff:.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the fully-convolutional scanner against sliding windows")
+    parser.add_argument('image_dir', nargs='?', default='dataset')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--scenes', type=int, default=5)
+    parser.add_argument('--size', type=int, nargs=2, default=[1280, 720], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--naive-stride', type=int, default=112, help="coarser sliding-window stride to compare")
+    args = parser.parse_args()
+    benchmark(args.image_dir, args.scenes, tuple(args.size), args.model, args.naive_stride)
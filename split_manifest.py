@@ -0,0 +1,169 @@
+"""Train/val/test splits as manifests instead of copied folders.
+
+splitfolders.ratio copies every image into output/train|val|test, which
+doubles the disk space and has to be redone whenever the ratio or the seed
+changes. write_splits instead writes one small JSON manifest per split.
+Each manifest holds the image paths, their labels and the class indices,
+in the same layout as a packed directory's index.json. Writing them takes
+milliseconds. The loaders (input_pipeline.make_dataset and list_split,
+packed_dataset, classify_dir, distill, export_tflite and evaluate_cascade)
+accept a manifest path wherever they accept a class-per-folder tree.
+
+The dataset was grown with Augmentor, which names every augmented copy
+after its source image, e.g. 0_original_1230.jpg_<uuid>.jpg for 1230.jpg.
+Images are therefore split as groups: a source image and all of its
+augmented siblings always land in the same split, so the validation and
+test sets never contain near-copies of training images. The split is
+stratified per class folder, and groups are assigned in a seeded shuffle
+until each split holds its share of the images.
+
+Paths in a manifest are stored as they were found, so relative to the
+working directory when write_splits ran. Run the tools from that same
+directory, which is the repository root.
+
+    python split_manifest.py dataset/Dataset2 --ratio .75 .2 .05 --seed 1337
+"""
+import argparse
+import json
+import os
+import random
+import re
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from preprocessing import list_image_paths
+
+SPLITS_DIR = 'splits'
+SPLIT_NAMES = ('train', 'val', 'test')
+DEFAULT_RATIO = (0.75, 0.2, 0.05)
+DEFAULT_SEED = 1337
+
+# <class>_original_<source file>_<uuid>.<ext>, as written by Augmentor
+_AUGMENTED_NAME = re.compile(r'^.+?_original_(.+)_[0-9a-f]{8}(?:-[0-9a-f]{4}){3}-[0-9a-f]{12}\.\w+$')
+
+
+def source_id(path):
+    """File name of the image path was augmented from, or its own file name"""
+    filename = os.path.basename(path)
+    match = _AUGMENTED_NAME.match(filename)
+    return match.group(1) if match else filename
+
+
+def is_manifest(path):
+    return path.endswith('.json') and os.path.isfile(path)
+
+
+def load_manifest(path):
+    """Return (image paths, integer labels, class_indices) of a split manifest"""
+    with open(path) as f:
+        manifest = json.load(f)
+    return manifest['paths'], np.array(manifest['labels']), manifest['classes']
+
+
+def list_images(directory, classes=None):
+    """Return (image paths, integer labels, class_indices) of a manifest or class-per-folder tree
+
+    Tree classes are the sorted subfolder names, or just those in classes.
+    """
+    if is_manifest(directory):
+        return load_manifest(directory)
+    class_names = sorted(classes or (entry.name for entry in os.scandir(directory) if entry.is_dir()))
+    paths, labels = [], []
+    for index, class_name in enumerate(class_names):
+        class_paths = list_image_paths(os.path.join(directory, class_name))
+        paths.extend(class_paths)
+        labels.extend([index] * len(class_paths))
+    return paths, np.array(labels), {class_name: index for index, class_name in enumerate(class_names)}
+
+
+def split_path(root, split):
+    """root/<split>.json if root holds manifests, else the root/<split> folder"""
+    manifest = os.path.join(root, f'{split}.json')
+    return manifest if os.path.isfile(manifest) else os.path.join(root, split)
+
+
+def make_splits(directory, ratio=DEFAULT_RATIO, seed=DEFAULT_SEED, classes=None):
+    """Return ({split: [(path, label, group)]}, class_indices), never splitting a source group
+
+    directory is a class-per-folder tree or a manifest, e.g. a deduplicated
+    one from near_duplicates.
+    """
+    paths, labels, class_indices = list_images(directory, classes)
+    bounds = np.cumsum(ratio) / np.sum(ratio)
+    rng = random.Random(seed)
+    splits = {name: [] for name in SPLIT_NAMES[:len(ratio)]}
+
+    for class_name, label in sorted(class_indices.items(), key=lambda item: item[1]):
+        groups = defaultdict(list)
+        for path in (path for path, path_label in zip(paths, labels) if path_label == label):
+            groups[source_id(path)].append(path)
+        keys = sorted(groups)
+        rng.shuffle(keys)
+
+        total = sum(len(paths) for paths in groups.values())
+        assigned = 0
+        for key in keys:
+            # A group goes to the split its middle image would fall in
+            middle = (assigned + len(groups[key]) / 2) / total
+            name = SPLIT_NAMES[min(int(np.searchsorted(bounds, middle, side='right')), len(ratio) - 1)]
+            splits[name].extend((path, label, f'{class_name}/{key}') for path in groups[key])
+            assigned += len(groups[key])
+
+    return splits, class_indices
+
+
+def write_splits(directory, out_dir=SPLITS_DIR, ratio=DEFAULT_RATIO, seed=DEFAULT_SEED, classes=None):
+    """Write <out_dir>/<split>.json for every split and return their paths"""
+    splits, class_indices = make_splits(directory, ratio, seed, classes)
+    os.makedirs(out_dir, exist_ok=True)
+    written = {}
+    for name, rows in splits.items():
+        rows.sort()
+        manifest = {
+            'source': directory,
+            'split': name,
+            'ratio': list(ratio),
+            'seed': seed,
+            'classes': class_indices,
+            'paths': [path for path, _, _ in rows],
+            'labels': [label for _, label, _ in rows],
+            'groups': [group for _, _, group in rows],
+        }
+        written[name] = os.path.join(out_dir, f'{name}.json')
+        with open(written[name], 'w') as f:
+            json.dump(manifest, f, indent=1)
+    return written
+
+
+def summarize(manifest_paths):
+    """Print images, groups and per-class counts of each split, and any group found in two splits"""
+    seen = defaultdict(set)
+    print("| split | images | groups | per class |")
+    print("|---|---|---|---|")
+    for name, path in manifest_paths.items():
+        with open(path) as f:
+            manifest = json.load(f)
+        for group in manifest['groups']:
+            seen[group].add(name)
+        per_class = np.bincount(manifest['labels'], minlength=len(manifest['classes']))
+        print(f"| {name} | {len(manifest['paths'])} | {len(set(manifest['groups']))} | "
+              f"{' / '.join(map(str, per_class))} |")
+    straddling = sum(len(names) > 1 for names in seen.values())
+    print(f"Source groups in more than one split: {straddling}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write grouped train/val/test manifests for an image tree")
+    parser.add_argument('image_dir', nargs='?', default='dataset/Dataset2', help="class-per-folder tree or manifest")
+    parser.add_argument('--output', default=SPLITS_DIR, help="folder for train.json, val.json and test.json")
+    parser.add_argument('--ratio', type=float, nargs='+', default=list(DEFAULT_RATIO), help="train [val [test]]")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--classes', nargs='+', help="class folders to split (default: every subfolder)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    written = write_splits(args.image_dir, args.output, tuple(args.ratio), args.seed, args.classes)
+    print(f"Wrote {', '.join(written.values())} in {(time.perf_counter() - start) * 1000:.0f} ms\n")
+    summarize(written)
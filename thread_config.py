@@ -0,0 +1,62 @@
+"""Tuned CPU threading profile, applied before TensorFlow starts.
+
+tune_threads.py sweeps op-parallelism, OpenMP and oneDNN settings on the
+machine it runs on and writes the best 'latency' (batch 1) and 'throughput'
+(batched) profiles to thread_config.json. apply() puts one of them into
+effect. The OpenMP and oneDNN settings are environment variables that
+TensorFlow reads when it is imported, and its thread pools are sized when
+its runtime starts, so apply() has to run before either; predictor.py calls
+it ahead of its own TensorFlow import.
+
+Only the first call takes effect. Scripts that want a specific profile, like
+classify_dir.py, apply it before importing predictor; a later call that asks
+for a different mode or profile prints a warning instead of silently doing
+nothing, while a bare apply() just returns the profile already in effect.
+
+The profile is picked by the TF_THREAD_PROFILE environment variable
+(default 'latency'), and variables already set in the environment win over
+the file.
+"""
+import json
+import os
+
+THREAD_CONFIG_PATH = 'thread_config.json'
+LATENCY = 'latency'
+THROUGHPUT = 'throughput'
+
+_applied = None
+_applied_mode = None
+
+
+def load_profile(mode=LATENCY, path=THREAD_CONFIG_PATH):
+    """Return the tuned profile for mode, or None if it has not been tuned"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)['profiles'].get(mode)
+
+
+def apply(mode=None, profile=None, path=THREAD_CONFIG_PATH):
+    """Apply profile, or the tuned one for mode, and return it; only the first call has any effect"""
+    global _applied, _applied_mode
+    if _applied is not None:
+        if (mode is not None and mode != _applied_mode) or (profile is not None and profile != _applied):
+            print(f"Thread profile {mode or 'custom'!r} not applied, {_applied_mode!r} is already in effect")
+        return _applied
+
+    mode = mode or os.environ.get('TF_THREAD_PROFILE', LATENCY)
+    _applied_mode = 'custom' if profile else mode
+    _applied = profile or load_profile(mode, path) or {}
+    if not _applied:
+        return _applied
+
+    os.environ.setdefault('OMP_NUM_THREADS', str(_applied['omp_num_threads']))
+    os.environ.setdefault('TF_ENABLE_ONEDNN_OPTS', '1' if _applied['onednn'] else '0')
+
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(_applied['intra_op_threads'])
+        tf.config.threading.set_inter_op_parallelism_threads(_applied['inter_op_threads'])
+    except RuntimeError as e:
+        print(f"Thread profile {mode!r} not applied, TensorFlow is already running: {e}")
+    return _applied
@@ -0,0 +1,279 @@
+"""Multi-object tracking so each vehicle is classified once, not every frame.
+
+A vehicle stays in view for dozens of frames, so running the classifier
+on every detection in every frame repeats the same work. Tracker follows
+detection boxes from frame to frame. Each track has a constant-velocity
+Kalman filter over (cx, cy, w, h). Detections are matched to the
+predicted boxes by IoU first and by centroid distance for any left over.
+All tracks are stored as arrays, so predict and update are a few NumPy
+operations however many vehicles are in view.
+
+TrackClassifier runs the classifier on the crops of new tracks and
+re-checks each track every refresh_frames frames. Between checks the
+track keeps its last label. Boxes can come from any detector, for
+example scene_scanner.SceneScanner.regions().
+
+Run ``python tracker.py [image_dir]`` to count the classifications saved on
+a synthetic stream of dataset images moving across a background.
+"""
+import argparse
+import time
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import TARGET_SIZE, BatchBuffer, list_image_paths
+
+DEFAULT_IOU_THRESHOLD = 0.3
+DEFAULT_MAX_DISTANCE = 1.0
+DEFAULT_MAX_AGE = 5
+DEFAULT_REFRESH_FRAMES = 30
+
+# Constant-velocity model over [cx, cy, w, h, vx, vy]; only the box is measured
+_F = np.eye(6)
+_F[0, 4] = _F[1, 5] = 1
+_Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.5, 0.5])
+_R = np.diag([4.0, 4.0, 16.0, 16.0])
+_INITIAL_P = np.diag([10.0, 10.0, 10.0, 10.0, 1000.0, 1000.0])
+
+
+def _to_state(boxes):
+    """(N, 4) x0, y0, x1, y1 boxes -> (N, 4) cx, cy, w, h"""
+    return np.column_stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2,
+                            boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]])
+
+
+def _to_boxes(state):
+    half_w, half_h = state[:, 2] / 2, state[:, 3] / 2
+    return np.column_stack([state[:, 0] - half_w, state[:, 1] - half_h, state[:, 0] + half_w, state[:, 1] + half_h])
+
+
+def iou_matrix(a, b):
+    """(len(a), len(b)) IoU between two sets of x0, y0, x1, y1 boxes"""
+    width = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    height = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    intersection = width * height
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def _greedy_match(scores, threshold, rows, cols):
+    """Pair the highest-scoring (row, col) first among the still unmatched, while score >= threshold"""
+    pairs = []
+    if scores.size == 0:
+        return pairs
+    used_rows, used_cols = set(), set()
+    for flat in np.argsort(-scores, axis=None):
+        row, col = divmod(int(flat), scores.shape[1])
+        if scores[row, col] < threshold:
+            break
+        if row not in used_rows and col not in used_cols:
+            used_rows.add(row)
+            used_cols.add(col)
+            pairs.append((rows[row], cols[col]))
+    return pairs
+
+
+class Tracker:
+    def __init__(self, iou_threshold=DEFAULT_IOU_THRESHOLD, max_distance=DEFAULT_MAX_DISTANCE,
+                 max_age=DEFAULT_MAX_AGE):
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance  # in units of the track's box size
+        self.max_age = max_age
+        self.ids = np.empty(0, dtype=int)
+        self.x = np.empty((0, 6))
+        self.P = np.empty((0, 6, 6))
+        self.misses = np.empty(0, dtype=int)
+        self.next_id = 1
+
+    def _match(self, boxes):
+        predicted = _to_boxes(self.x[:, :4])
+        pairs = _greedy_match(iou_matrix(predicted, boxes), self.iou_threshold,
+                              np.arange(len(predicted)), np.arange(len(boxes)))
+
+        # Fast or small vehicles may not overlap their prediction; fall back to centroid distance
+        tracks_left = np.setdiff1d(np.arange(len(predicted)), [t for t, _ in pairs])
+        boxes_left = np.setdiff1d(np.arange(len(boxes)), [d for _, d in pairs])
+        if len(tracks_left) and len(boxes_left):
+            centers = _to_state(boxes[boxes_left])[:, :2]
+            scale = np.sqrt(np.maximum(self.x[tracks_left, 2] * self.x[tracks_left, 3], 1e-9))
+            distance = np.linalg.norm(self.x[tracks_left, None, :2] - centers[None], axis=2) / scale[:, None]
+            pairs += _greedy_match(-distance, -self.max_distance, tracks_left, boxes_left)
+        return pairs
+
+    def update(self, boxes):
+        """Advance one frame with (D, 4) x0, y0, x1, y1 detections and return each detection's track id"""
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+
+        # Predict every track forward one frame
+        self.x = self.x @ _F.T
+        self.P = _F @ self.P @ _F.T + _Q
+
+        pairs = self._match(boxes)
+        detection_ids = np.zeros(len(boxes), dtype=int)
+        if pairs:
+            tracks, detections = map(np.array, zip(*pairs))
+            # Kalman update for all matched tracks at once; H just selects the box part
+            residual = _to_state(boxes[detections]) - self.x[tracks, :4]
+            S = self.P[tracks][:, :4, :4] + _R
+            K = self.P[tracks][:, :, :4] @ np.linalg.inv(S)
+            self.x[tracks] += np.einsum('nij,nj->ni', K, residual)
+            self.P[tracks] -= K @ self.P[tracks][:, :4, :]
+            self.misses[tracks] = 0
+            detection_ids[detections] = self.ids[tracks]
+
+        matched_tracks = np.zeros(len(self.ids), dtype=bool)
+        if pairs:
+            matched_tracks[tracks] = True
+        self.misses[~matched_tracks] += 1
+
+        # Unmatched detections start new tracks
+        new = np.flatnonzero(detection_ids == 0)
+        if len(new):
+            new_ids = np.arange(self.next_id, self.next_id + len(new))
+            self.next_id += len(new)
+            detection_ids[new] = new_ids
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.x = np.vstack([self.x, np.column_stack([_to_state(boxes[new]), np.zeros((len(new), 2))])])
+            self.P = np.concatenate([self.P, np.repeat(_INITIAL_P[None], len(new), axis=0)])
+            self.misses = np.concatenate([self.misses, np.zeros(len(new), dtype=int)])
+
+        alive = self.misses <= self.max_age
+        self.ids, self.x, self.P, self.misses = self.ids[alive], self.x[alive], self.P[alive], self.misses[alive]
+        return detection_ids
+
+
+class TrackClassifier:
+    """Classifies a tracked vehicle when its track starts and every refresh_frames frames after
+
+    predict_fn takes a (N, 224, 224, 3) float32 batch, e.g. a Predictor or
+    InferenceQueue.predict, and returns (N, classes) probabilities.
+    """
+
+    def __init__(self, predict_fn, tracker=None, refresh_frames=DEFAULT_REFRESH_FRAMES):
+        self.predict_fn = predict_fn
+        self.tracker = tracker or Tracker()
+        self.refresh_frames = refresh_frames
+        self.labels = {}  # track id -> (emergency probability, frame it was classified on)
+        self.frame_index = 0
+        self.classifications = 0
+        self._buffer = BatchBuffer(8)
+
+    def update(self, frame, boxes):
+        """Track boxes in frame (H x W x 3 uint8) and return [(track id, emergency probability)] per box"""
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        track_ids = self.tracker.update(boxes)
+
+        due = [i for i, track_id in enumerate(track_ids)
+               if track_id not in self.labels or self.frame_index - self.labels[track_id][1] >= self.refresh_frames]
+        if due:
+            image = Image.fromarray(frame)
+            crops = [image.crop(tuple(int(round(v)) for v in boxes[i])).resize(TARGET_SIZE, Image.NEAREST)
+                     for i in due]
+            if len(crops) > len(self._buffer.array):
+                self._buffer = BatchBuffer(len(crops))
+            for slot, crop in enumerate(crops):
+                self._buffer.fill(slot, crop)
+            probabilities = self.predict_fn(self._buffer.array[:len(crops)])
+            for i, row in zip(due, probabilities):
+                self.labels[track_ids[i]] = (float(row[1]), self.frame_index)
+            self.classifications += len(due)
+
+        # Forget labels of tracks the tracker has dropped
+        live = set(self.tracker.ids.tolist())
+        self.labels = {track_id: label for track_id, label in self.labels.items() if track_id in live}
+        self.frame_index += 1
+        return [(int(track_id), self.labels[track_id][0]) for track_id in track_ids]
+
+
+def synthetic_stream(image_dir, frames=300, size=(960, 540), spawn_rate=0.05, jitter=3.0, miss_rate=0.05, seed=0):
+    """Yield (frame, detection boxes, true vehicle ids) with dataset images driving across a background
+
+    Detections are the true boxes with Gaussian jitter, and each is dropped
+    with probability miss_rate to exercise the tracker's coasting.
+    """
+    rng = np.random.default_rng(seed)
+    normal = list_image_paths(f"{image_dir}/0")
+    vehicles_pool = normal + list_image_paths(f"{image_dir}/1")
+    background = Image.open(normal[rng.integers(len(normal))]).convert('RGB').resize(size, Image.BILINEAR)
+
+    vehicles = []  # [vehicle id, image, x, y, vx, vy]
+    next_vehicle = 0
+    for _ in range(frames):
+        if rng.random() < spawn_rate or not vehicles:
+            side = int(rng.integers(96, 161))
+            img = Image.open(vehicles_pool[rng.integers(len(vehicles_pool))]).convert('RGB').resize((side, side))
+            from_left = rng.random() < 0.5
+            x = -side + 1.0 if from_left else float(size[0] - 1)
+            y = float(rng.integers(0, size[1] - side))
+            vx = rng.uniform(3, 8) * (1 if from_left else -1)
+            vehicles.append([next_vehicle, img, x, y, vx, rng.uniform(-0.5, 0.5)])
+            next_vehicle += 1
+
+        frame = background.copy()
+        boxes, ids = [], []
+        for vehicle in vehicles:
+            vehicle_id, img, x, y = vehicle[:4]
+            frame.paste(img, (int(x), int(y)))
+            box = np.clip([x, y, x + img.size[0], y + img.size[1]], 0, [size[0], size[1], size[0], size[1]])
+            if box[2] - box[0] > 16 and rng.random() >= miss_rate:
+                boxes.append(box + rng.normal(0, jitter, 4))
+                ids.append(vehicle_id)
+            vehicle[2] += vehicle[4]
+            vehicle[3] += vehicle[5]
+        vehicles = [v for v in vehicles if -v[1].size[0] < v[2] < size[0]]
+        yield np.asarray(frame), np.array(boxes).reshape(-1, 4), ids
+
+
+def evaluate(image_dir, frames=300, fps=30, refresh_frames=DEFAULT_REFRESH_FRAMES, backend='keras', seed=0):
+    """Print classifications and classifier time per frame vs per track on a synthetic stream"""
+    from predictor import load_predictor
+
+    predictor = load_predictor(backend)
+    timed = {'per detection': 0.0, 'per track': 0.0}
+
+    def timed_predict(name):
+        def predict(batch):
+            start = time.perf_counter()
+            result = predictor(batch)
+            timed[name] += time.perf_counter() - start
+            return result
+        return predict
+
+    track_classifier = TrackClassifier(timed_predict('per track'), refresh_frames=refresh_frames)
+    per_detection = TrackClassifier(timed_predict('per detection'), refresh_frames=0)
+
+    detections = agreements = 0
+    track_for_vehicle = {}
+    for frame, boxes, vehicle_ids in synthetic_stream(image_dir, frames, seed=seed):
+        tracked = track_classifier.update(frame, boxes)
+        baseline = per_detection.update(frame, boxes)
+        detections += len(boxes)
+        for (track_id, probability), (_, reference), vehicle_id in zip(tracked, baseline, vehicle_ids):
+            agreements += (probability > 0.5) == (reference > 0.5)
+            track_for_vehicle.setdefault(vehicle_id, set()).add(track_id)
+
+    seconds = frames / fps
+    saved = per_detection.classifications - track_classifier.classifications
+    tracks = len(set().union(*track_for_vehicle.values())) if track_for_vehicle else 0
+    print(f"{frames} frames ({seconds:.0f}s at {fps} fps), {detections} detections of "
+          f"{len(track_for_vehicle)} vehicles in {tracks} tracks, refresh every {refresh_frames} frames")
+    print(f"{'':<16}{'classifications':>16}{'per second':>12}{'model ms':>10}")
+    for name, classifier in [('per detection', per_detection), ('per track', track_classifier)]:
+        print(f"{name:<16}{classifier.classifications:>16}{classifier.classifications / seconds:>12.1f}"
+              f"{timed[name] * 1000:>10.0f}")
+    print(f"Saved {saved} classifications ({saved / max(per_detection.classifications, 1):.1%}, "
+          f"{saved / seconds:.1f}/s); carried labels agree with per-detection labels "
+          f"on {agreements / max(detections, 1):.1%} of detections")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure classifications saved by track-level classification")
+    parser.add_argument('image_dir', nargs='?', default='dataset')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--refresh-frames', type=int, default=DEFAULT_REFRESH_FRAMES)
+    parser.add_argument('--backend', default='keras')
+    args = parser.parse_args()
+    evaluate(args.image_dir, args.frames, args.fps, args.refresh_frames, args.backend)
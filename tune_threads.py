@@ -0,0 +1,122 @@
+"""Find the best TensorFlow CPU thread settings for the classifier on this machine.
+
+Sweeps intra-op threads (with OMP_NUM_THREADS to match), inter-op threads
+and oneDNN on/off. Each combination runs in a fresh process, because the
+settings are fixed once TensorFlow is imported. For each one it measures
+the p50 latency of single images, as the simulators send them, and the
+throughput at --batch-size, as classify_dir runs. The fastest profile for
+each use is written to thread_config.json, which thread_config.apply()
+loads at startup.
+
+    python tune_threads.py --batch-size 32
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import thread_config
+from model_config import INPUT_SHAPE, MODEL_PATH
+
+
+def default_thread_counts():
+    """Powers of two up to the CPU count, plus the CPU count itself"""
+    cpus = os.cpu_count()
+    counts = {cpus}
+    count = 1
+    while count < cpus:
+        counts.add(count)
+        count *= 2
+    return sorted(counts)
+
+
+def measure(profile, model_path=MODEL_PATH, batch_size=32, runs=50):
+    """Apply profile in this process and time batch-1 latency and batched throughput"""
+    thread_config.apply(profile=profile)
+    from predictor import Predictor
+
+    predictor = Predictor.from_path(model_path, warmup=False)
+    predictor.warmup(batch_sizes=(1, batch_size))
+
+    rng = np.random.default_rng(0)
+    img_array = rng.random((1,) + INPUT_SHAPE, dtype=np.float32)
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        predictor(img_array)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    batch = rng.random((batch_size,) + INPUT_SHAPE, dtype=np.float32)
+    repeats = max(3, runs * 4 // batch_size)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predictor(batch)
+    images_per_sec = batch_size * repeats / (time.perf_counter() - start)
+
+    return {'p50_ms': float(np.percentile(latencies, 50)), 'images_per_sec': images_per_sec}
+
+
+def tune(model_path=MODEL_PATH, intra_counts=None, inter_counts=(1, 2), batch_size=32, runs=50):
+    """Run the sweep and return the config file contents"""
+    sweep = []
+    for onednn, intra, inter in itertools.product((True, False), intra_counts or default_thread_counts(),
+                                                  inter_counts):
+        profile = {
+            'intra_op_threads': intra,
+            'inter_op_threads': inter,
+            'omp_num_threads': intra,
+            'onednn': onednn,
+        }
+        command = [sys.executable, __file__, '--run-one', json.dumps(profile), '--model', model_path,
+                   '--batch-size', str(batch_size), '--runs', str(runs)]
+        # Start each run from a clean slate so the parent's settings don't leak in
+        env = {k: v for k, v in os.environ.items() if k not in ('OMP_NUM_THREADS', 'TF_ENABLE_ONEDNN_OPTS')}
+        process = subprocess.run(command, capture_output=True, text=True, env=env)
+        if process.returncode != 0:
+            print(f"{profile} failed: {process.stderr.strip().splitlines()[-1:]}")
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        print(f"onednn={onednn!s:<5} intra={intra:<3} inter={inter:<3} "
+              f"p50 {result['p50_ms']:8.2f} ms  {result['images_per_sec']:8.1f} images/sec", flush=True)
+        sweep.append({**profile, **result})
+
+    if not sweep:
+        raise RuntimeError("Every configuration failed")
+    latency = min(sweep, key=lambda result: result['p50_ms'])
+    throughput = max(sweep, key=lambda result: result['images_per_sec'])
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'host': {'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'model': model_path,
+        'batch_size': batch_size,
+        'profiles': {thread_config.LATENCY: latency, thread_config.THROUGHPUT: throughput},
+        'sweep': sweep,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune TensorFlow CPU threading for latency and throughput")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--intra', type=int, nargs='+', help="intra-op thread counts to try")
+    parser.add_argument('--inter', type=int, nargs='+', default=[1, 2], help="inter-op thread counts to try")
+    parser.add_argument('--batch-size', type=int, default=32, help="batch size for the throughput profile")
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--output', default=thread_config.THREAD_CONFIG_PATH)
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(measure(json.loads(args.run_one), args.model, args.batch_size, args.runs)))
+    else:
+        config = tune(args.model, args.intra, args.inter, args.batch_size, args.runs)
+        with open(args.output, 'w') as f:
+            json.dump(config, f, indent=2)
+        for mode, profile in config['profiles'].items():
+            print(f"Best {mode} profile: {profile}")
+        print(f"Wrote {args.output}")